@@ -0,0 +1,158 @@
+"""
+Benchmarks of the parsers, MSA metrics and the tree topology filtering on generated input files.
+
+The benchmarks follow the conventions of asv (airspeed velocity): each class generates its input files
+in setup for each combination of params, time_* methods are timed and peakmem_* methods report the peak memory.
+They can be run with asv (see asv.conf.json) or without any additional dependency using benchmarks/run.py.
+"""
+from . import generators
+
+from pyphyutils.consel_parser import get_consel_results
+from pyphyutils.encoded_msa import EncodedMSA
+from pyphyutils.iqtree_statstest_parser import get_iqtree_results
+from pyphyutils.iqtree_topology_tests import filter_tree_topologies
+from pyphyutils.msa_metrics import (
+    bollback_multinomial,
+    get_msa_avg_entropy,
+    read_encoded_alignment,
+    treelikeness_score,
+)
+from pyphyutils.raxmlng_parser import RaxmlNGLog, get_pairwise_rfdistances, load_pairwise_rfdistances
+
+import os
+import random
+from tempfile import TemporaryDirectory
+
+
+class _GeneratedFiles:
+    """
+    Base class of the benchmarks: provides a temporary directory for the generated input files.
+    """
+
+    def setup(self, *params):
+        self._tmpdir = TemporaryDirectory()
+        self.dir = self._tmpdir.name
+
+    def teardown(self, *params):
+        self._tmpdir.cleanup()
+
+
+class IQTreeResults(_GeneratedFiles):
+    params = [100, 1000, 10000]
+    param_names = ["num_trees"]
+
+    def setup(self, num_trees):
+        super().setup()
+        self.iqtree_file = os.path.join(self.dir, "tests.iqtree")
+        generators.write_iqtree_file(self.iqtree_file, num_trees)
+
+    def time_get_iqtree_results(self, num_trees):
+        get_iqtree_results(self.iqtree_file)
+
+    def peakmem_get_iqtree_results(self, num_trees):
+        get_iqtree_results(self.iqtree_file)
+
+
+class ConselResults(_GeneratedFiles):
+    params = [100, 1000, 10000]
+    param_names = ["num_trees"]
+
+    def setup(self, num_trees):
+        super().setup()
+        self.consel_file = os.path.join(self.dir, "tests.consel")
+        generators.write_consel_file(self.consel_file, num_trees)
+
+    def time_get_consel_results(self, num_trees):
+        get_consel_results(self.consel_file)
+
+
+class RaxmlNGLogParsing(_GeneratedFiles):
+    params = [10, 100, 1000]
+    param_names = ["num_search_trees"]
+
+    def setup(self, num_search_trees):
+        super().setup()
+        self.log_file = os.path.join(self.dir, "search.raxml.log")
+        generators.write_raxmlng_log(self.log_file, num_search_trees)
+
+    def time_raxmlng_log_record(self, num_search_trees):
+        RaxmlNGLog(self.log_file).to_record()
+
+
+class PairwiseRFDistances(_GeneratedFiles):
+    params = [100, 500, 1000]
+    param_names = ["num_trees"]
+
+    def setup(self, num_trees):
+        super().setup()
+        self.rfdistances_file = os.path.join(self.dir, "rfdist.raxml.rfDistances")
+        generators.write_rfdistances_file(self.rfdistances_file, num_trees)
+
+    def time_get_pairwise_rfdistances(self, num_trees):
+        get_pairwise_rfdistances(self.rfdistances_file)
+
+    def peakmem_get_pairwise_rfdistances(self, num_trees):
+        get_pairwise_rfdistances(self.rfdistances_file)
+
+    def time_load_pairwise_rfdistances(self, num_trees):
+        load_pairwise_rfdistances(self.rfdistances_file)
+
+    def peakmem_load_pairwise_rfdistances(self, num_trees):
+        load_pairwise_rfdistances(self.rfdistances_file)
+
+
+class MSAMetrics(_GeneratedFiles):
+    params = [["DNA", "AA"], [(50, 1000), (200, 10000)]]
+    param_names = ["data_type", "msa_size"]
+
+    def setup(self, data_type, msa_size):
+        super().setup()
+        num_taxa, num_sites = msa_size
+        self.msa_file = os.path.join(self.dir, "msa.phy")
+        generators.write_alignment(self.msa_file, num_taxa, num_sites, data_type)
+        self.msa = read_encoded_alignment(self.msa_file, data_type)
+
+    def _get_msa(self):
+        # EncodedMSA caches the site patterns, so each call gets a new instance sharing the matrix
+        return EncodedMSA(self.msa.matrix, self.msa.taxa, self.msa.data_type)
+
+    def time_read_encoded_alignment(self, data_type, msa_size):
+        read_encoded_alignment(self.msa_file, data_type)
+
+    def time_get_msa_avg_entropy(self, data_type, msa_size):
+        get_msa_avg_entropy(self._get_msa())
+
+    def peakmem_get_msa_avg_entropy(self, data_type, msa_size):
+        get_msa_avg_entropy(self._get_msa())
+
+    def time_bollback_multinomial(self, data_type, msa_size):
+        bollback_multinomial(self._get_msa())
+
+    def peakmem_bollback_multinomial(self, data_type, msa_size):
+        bollback_multinomial(self._get_msa())
+
+    def time_treelikeness_score(self, data_type, msa_size):
+        # the quartets are sampled using the random module
+        random.seed(0)
+        treelikeness_score(self._get_msa(), data_type, num_samples=100)
+
+    def peakmem_treelikeness_score(self, data_type, msa_size):
+        random.seed(0)
+        treelikeness_score(self._get_msa(), data_type, num_samples=100)
+
+
+class FilterTreeTopologies(_GeneratedFiles):
+    # only the built-in RF distance engine is benchmarked, filtering with raxml-ng --rfdist requires the adapted raxml-ng
+    params = [100, 1000]
+    param_names = ["num_trees"]
+
+    def setup(self, num_trees):
+        super().setup()
+        self.trees_file = os.path.join(self.dir, "trees")
+        generators.write_trees_file(self.trees_file, num_trees, num_taxa=50, num_topologies=num_trees // 10)
+
+    def time_filter_tree_topologies(self, num_trees):
+        filter_tree_topologies(self.trees_file)
+
+    def peakmem_filter_tree_topologies(self, num_trees):
+        filter_tree_topologies(self.trees_file)
@@ -0,0 +1,258 @@
+"""
+Deterministic generators for the benchmark input files.
+All generators take a seed, so the same arguments always produce the same file.
+"""
+from pyphyutils.custom_types import *
+
+import numpy as np
+import random
+
+
+DNA_STATES = "ACGT"
+AA_STATES = "ARNDCQEGHILKMFPSTWYV"
+# characters that are inserted into the alignments in addition to the regular states
+UNDETERMINED_STATES = {"DNA": "-?N", "AA": "-?X"}
+
+IQTREE_TEST_NAMES = ["bp-RELL", "p-KH", "p-SH", "p-WKH", "p-WSH", "c-ELW", "p-AU"]
+
+
+def write_alignment(
+    msa_file: FilePath,
+    num_taxa: int,
+    num_sites: int,
+    data_type: str = "DNA",
+    file_format: str = "phylip",
+    mutation_rate: float = 0.2,
+    gap_rate: float = 0.02,
+    seed: int = 0,
+) -> None:
+    """
+    Writes an alignment of num_taxa sequences that are mutated copies of a random ancestral sequence.
+
+    Args:
+        data_type: DNA or AA.
+        file_format: phylip (sequential) or fasta (60 characters per line).
+        mutation_rate: Probability that a site differs from the ancestral sequence.
+        gap_rate: Probability that a site is undetermined (gap, ? or N/X).
+    """
+    if data_type not in UNDETERMINED_STATES:
+        raise ValueError(f"Unsupported data type {data_type}, use DNA or AA.")
+    if file_format not in ["phylip", "fasta"]:
+        raise ValueError(f"Unsupported file format {file_format}, use phylip or fasta.")
+
+    states = np.frombuffer((DNA_STATES if data_type == "DNA" else AA_STATES).encode(), dtype=np.uint8)
+    undetermined = np.frombuffer(UNDETERMINED_STATES[data_type].encode(), dtype=np.uint8)
+
+    rng = np.random.default_rng(seed)
+    ancestor = rng.choice(states, size=num_sites)
+    sequences = np.tile(ancestor, (num_taxa, 1))
+    mutated = rng.random(sequences.shape) < mutation_rate
+    sequences[mutated] = rng.choice(states, size=int(mutated.sum()))
+    gaps = rng.random(sequences.shape) < gap_rate
+    sequences[gaps] = rng.choice(undetermined, size=int(gaps.sum()))
+
+    with open(msa_file, "w") as f:
+        if file_format == "phylip":
+            f.write(f"{num_taxa} {num_sites}\n")
+        for i, sequence in enumerate(sequences):
+            sequence = sequence.tobytes().decode()
+            if file_format == "phylip":
+                f.write(f"taxon{i} {sequence}\n")
+            else:
+                f.write(f">taxon{i}\n")
+                for start in range(0, num_sites, 60):
+                    f.write(sequence[start:start + 60] + "\n")
+
+
+def _get_random_topology(taxa: List[str], rnd: random.Random) -> List:
+    # joins random pairs of subtrees until three subtrees are left, the unrooted trifurcation at the top
+    subtrees = list(taxa)
+    while len(subtrees) > 3:
+        i, j = sorted(rnd.sample(range(len(subtrees)), 2), reverse=True)
+        subtrees.append([subtrees.pop(i), subtrees.pop(j)])
+    return subtrees
+
+
+def _to_newick(subtree, rnd: random.Random) -> str:
+    # shuffles the children and draws new branch lengths, so trees with the same topology differ as strings
+    if isinstance(subtree, str):
+        return f"{subtree}:{rnd.uniform(0.001, 0.5):.6f}"
+    children = [_to_newick(child, rnd) for child in subtree]
+    rnd.shuffle(children)
+    return f"({','.join(children)}):{rnd.uniform(0.001, 0.5):.6f}"
+
+
+def write_trees_file(
+    trees_file: FilePath, num_trees: int, num_taxa: int, num_topologies: int, seed: int = 0
+) -> List[List[int]]:
+    """
+    Writes num_trees newick trees with num_taxa taxa drawn from num_topologies random topologies.
+    Trees of the same topology differ in the order of the children and the branch lengths.
+
+    Returns:
+        The IDs of the trees of each topology, ordered by the first tree of each topology.
+    """
+    rnd = random.Random(seed)
+    taxa = [f"taxon{i}" for i in range(num_taxa)]
+    topologies = [_get_random_topology(taxa, rnd) for _ in range(num_topologies)]
+
+    clusters = {}
+    with open(trees_file, "w") as f:
+        for tree_id in range(num_trees):
+            # the first trees cover all topologies
+            topology_id = tree_id if tree_id < num_topologies else rnd.randrange(num_topologies)
+            clusters.setdefault(topology_id, []).append(tree_id)
+            children = [_to_newick(child, rnd) for child in topologies[topology_id]]
+            f.write(f"({','.join(children)});\n")
+
+    return list(clusters.values())
+
+
+def write_raxmlng_log(log_file: FilePath, num_search_trees: int, seed: int = 0) -> None:
+    """
+    Writes a RAxML-NG tree search log with num_search_trees tree searches from random starting trees.
+    """
+    rnd = random.Random(seed)
+    lines = [
+        "",
+        "RAxML-NG v. 1.1.0 released on 29.11.2021 by The Exelixis Lab.",
+        "",
+        "RAxML-NG was called at 01-Jan-2022 00:00:00 as follows:",
+        "",
+        f"raxml-ng --msa msa.phy --model GTR+G --prefix search --tree rand{{{num_search_trees}}} --seed {seed}",
+        "",
+        "Analysis options:",
+        "  run mode: ML tree search",
+        f"  start tree(s): random ({num_search_trees})",
+        f"  random seed: {seed}",
+        "  tip-inner: OFF",
+        "  pattern compression: ON",
+        "  per-rate scalers: OFF",
+        "  site repeats: ON",
+        "  branch lengths: proportional (ML estimate, algorithm: NR-FAST)",
+        "  SIMD kernels: AVX2",
+        "  parallelization: coarse-grained (auto), PTHREADS (auto)",
+        "",
+        "[00:00:00] Reading alignment from file: msa.phy",
+        "[00:00:00] Loaded alignment with 100 taxa and 1000 sites",
+        "",
+    ]
+
+    elapsed = 0.0
+    llhs = []
+    for i in range(1, num_search_trees + 1):
+        llh = -rnd.uniform(5000, 6000)
+        llhs.append(llh)
+        for step in range(20):
+            elapsed += rnd.uniform(0.01, 1.0)
+            timestamp = f"[{int(elapsed) // 3600:02d}:{int(elapsed) // 60 % 60:02d}:{int(elapsed) % 60:02d}]"
+            lines.append(f"{timestamp} SPR radius = {step % 10 + 1}, LogLikelihood: {llh - 20 + step:.6f}")
+        lines.append(
+            f"[{int(elapsed) // 3600:02d}:{int(elapsed) // 60 % 60:02d}:{int(elapsed) % 60:02d}] "
+            f"ML tree search #{i}, logLikelihood: {llh:.6f}"
+        )
+        lines.append("")
+
+    lines += [
+        "Optimized model parameters:",
+        "",
+        "   Partition 0: noname",
+        "   Rate heterogeneity: GAMMA (4 cats, mean),  alpha: 0.529 (ML),  weights&rates: (0.250,0.039) (0.250,0.271) (0.250,0.840) (0.250,2.850)",
+        "",
+        f"Final LogLikelihood: {max(llhs):.6f}",
+        "",
+        "Best ML tree saved to: search.raxml.bestTree",
+        "",
+        "Execution log saved to: search.raxml.log",
+        "",
+        "Analysis started: 01-Jan-2022 00:00:00 / finished: 01-Jan-2022 00:00:00",
+        "",
+        f"Elapsed time: {elapsed:.3f} seconds",
+        "",
+    ]
+
+    with open(log_file, "w") as f:
+        f.write("\n".join(lines))
+
+
+def write_rfdistances_file(rfdistances_file: FilePath, num_trees: int, num_taxa: int = 100, seed: int = 0) -> None:
+    """
+    Writes the pairwise RF distances of num_trees trees in the format of the .raxml.rfDistances file.
+    """
+    rng = np.random.default_rng(seed)
+    max_rf = 2 * (num_taxa - 3)
+
+    with open(rfdistances_file, "w") as f:
+        for i in range(num_trees - 1):
+            other = np.arange(i + 1, num_trees)
+            abs_rf = rng.integers(0, max_rf // 2 + 1, size=len(other)) * 2
+            rows = np.stack([np.full(len(other), i), other, abs_rf, abs_rf / max_rf], axis=1)
+            np.savetxt(f, rows, fmt=["%d", "%d", "%d", "%.6f"])
+
+
+def write_iqtree_file(iqtree_file: FilePath, num_trees: int, seed: int = 0) -> None:
+    """
+    Writes an .iqtree file with the USER TREES table of the tree topology tests of num_trees trees.
+    """
+    rnd = random.Random(seed)
+    llhs = [-rnd.uniform(5700, 5800) for _ in range(num_trees)]
+    best_llh = max(llhs)
+
+    lines = [
+        "IQ-TREE 2.2.0 built Jun  1 2022",
+        "",
+        "Input file name: msa.phy",
+        "User tree file name: trees",
+        "Type of analysis: tree reconstruction",
+        f"Random seed number: {seed}",
+        "",
+        "USER TREES",
+        "----------",
+        "",
+        "See iqtree.trees for trees with branch lengths.",
+        "",
+        "Tree      logL    deltaL  " + "  ".join(IQTREE_TEST_NAMES),
+        "-" * 90,
+    ]
+    for i, llh in enumerate(llhs, start=1):
+        tests = "  ".join(f"{rnd.random():.4g} {rnd.choice('+-')}" for _ in IQTREE_TEST_NAMES)
+        lines.append(f"{i:3d} {llh:.6f} {best_llh - llh:9.4g}  {tests}")
+    lines += [
+        "",
+        "deltaL  : logL difference from the maximal logl in the set.",
+        "bp-RELL : bootstrap proportion using RELL method (Kishino et al. 1990).",
+        "",
+        "TIME STAMP",
+        "----------",
+        "",
+        "Date and time: Sat Jan  1 00:00:00 2022",
+        "Total CPU time used: 1.000 seconds (0h:0m:1s)",
+        "",
+    ]
+
+    with open(iqtree_file, "w") as f:
+        f.write("\n".join(lines))
+
+
+def write_consel_file(consel_file: FilePath, num_trees: int, seed: int = 0) -> None:
+    """
+    Writes the catpv output of CONSEL for num_trees trees.
+    """
+    rnd = random.Random(seed)
+    deltas = sorted([0.0] + [rnd.uniform(0, 100) for _ in range(num_trees - 1)])
+    items = list(range(1, num_trees + 1))
+    rnd.shuffle(items)
+
+    lines = ["# rank item    obs     au     np |     bp     pp     kh     sh    wkh    wsh |"]
+    for rank, (item, delta) in enumerate(zip(items, deltas), start=1):
+        # the observed value of the best tree is the negative difference to the second best tree
+        obs = -deltas[1] if rank == 1 and num_trees > 1 else delta
+        au, np_value, *p_values = [rnd.random() for _ in range(8)]
+        lines.append(
+            f"# {rank:4d} {item:4d} {obs:6.1f} {au:6.3f} {np_value:6.3f} | "
+            + " ".join(f"{p:6.3f}" for p in p_values)
+            + " |"
+        )
+
+    with open(consel_file, "w") as f:
+        f.write("\n".join(lines) + "\n")
@@ -0,0 +1,181 @@
+"""
+Runs the benchmarks without asv and compares the results against a stored baseline.
+
+    python -m benchmarks.run --compare
+    python -m benchmarks.run --save baseline.json
+    python -m benchmarks.run --compare baseline.json
+
+--compare without a file compares against the committed reference run benchmarks/baseline.json (see benchmarks/README.md).
+
+time_* benchmarks report the fastest of --repeat runs in seconds per call, peakmem_* benchmarks report the peak memory
+in bytes allocated by Python and NumPy during one run as measured by tracemalloc.
+"""
+from . import benchmarks
+
+import argparse
+import inspect
+import itertools
+import json
+import os
+import regex
+import sys
+import time
+import tracemalloc
+
+
+UNITS = {"time_": "seconds", "peakmem_": "bytes"}
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def _get_param_combinations(benchmark_class, quick: bool):
+    params = getattr(benchmark_class, "params", [])
+    if not params:
+        return [()]
+    if not isinstance(params[0], list):
+        params = [params]
+    if quick:
+        params = [p[:1] for p in params]
+    return list(itertools.product(*params))
+
+
+def _get_benchmark_methods(benchmark_class):
+    for name in sorted(vars(benchmark_class)):
+        for prefix, unit in UNITS.items():
+            if name.startswith(prefix):
+                yield name, unit
+
+
+def _time_calls(method, params, number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        method(*params)
+    return (time.perf_counter() - start) / number
+
+
+def _measure_time(method, params, repeat: int, min_run_time: float = 0.05) -> float:
+    # fast benchmarks are called multiple times per run, so each run takes at least min_run_time seconds
+    number = 1
+    timing = _time_calls(method, params, number)
+    while timing * number < min_run_time:
+        number = max(number * 2, int(min_run_time / max(timing, 1e-9)))
+        timing = _time_calls(method, params, number)
+
+    timings = [timing] + [_time_calls(method, params, number) for _ in range(repeat - 1)]
+    return min(timings)
+
+
+def _measure_peak_memory(method, params) -> int:
+    tracemalloc.start()
+    try:
+        method(*params)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_benchmarks(name_filter: str = None, repeat: int = 3, quick: bool = False):
+    """
+    Runs all benchmarks whose name "Class.method(params)" matches the regex name_filter.
+
+    Returns:
+        A dict mapping the name of each benchmark to a dict with its value and unit.
+    """
+    results = {}
+    classes = [
+        c for _, c in inspect.getmembers(benchmarks, inspect.isclass)
+        if c.__module__ == benchmarks.__name__ and not c.__name__.startswith("_")
+    ]
+
+    for benchmark_class in classes:
+        for params in _get_param_combinations(benchmark_class, quick):
+            methods = [
+                (name, unit) for name, unit in _get_benchmark_methods(benchmark_class)
+                if name_filter is None or regex.search(name_filter, f"{benchmark_class.__name__}.{name}{params}")
+            ]
+            if not methods:
+                continue
+
+            benchmark = benchmark_class()
+            benchmark.setup(*params)
+            try:
+                for name, unit in methods:
+                    full_name = f"{benchmark_class.__name__}.{name}{params}"
+                    method = getattr(benchmark, name)
+                    if unit == "seconds":
+                        value = _measure_time(method, params, repeat)
+                    else:
+                        value = _measure_peak_memory(method, params)
+                    results[full_name] = {"value": value, "unit": unit}
+                    print(f"{full_name:<80} {_format_value(value, unit):>12}", flush=True)
+            finally:
+                benchmark.teardown(*params)
+
+    return results
+
+
+def _format_value(value: float, unit: str) -> str:
+    if unit == "seconds":
+        return f"{value * 1000:.2f} ms"
+    return f"{value / (1 << 20):.2f} MiB"
+
+
+def compare_results(results, baseline, factor: float = 1.2):
+    """
+    Compares the results to the baseline results.
+
+    Returns:
+        A list of (name, baseline value, value, ratio, unit) for all benchmarks that are slower
+        or use more memory than factor times the baseline value.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline or not baseline[name]["value"]:
+            continue
+        baseline_value = baseline[name]["value"]
+        ratio = result["value"] / baseline_value
+        if ratio > factor:
+            regressions.append((name, baseline_value, result["value"], ratio, result["unit"]))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-b", "--bench", help="Only run the benchmarks whose name matches this regex.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each time_* benchmark.")
+    parser.add_argument("--quick", action="store_true", help="Only run the smallest input size of each benchmark.")
+    parser.add_argument("--save", help="Write the results to this JSON file.")
+    parser.add_argument(
+        "--compare",
+        nargs="?",
+        const=DEFAULT_BASELINE,
+        help="Compare the results against the baseline results in this JSON file (default: benchmarks/baseline.json).",
+    )
+    parser.add_argument(
+        "--factor", type=float, default=1.2, help="Report a regression if a result exceeds factor times the baseline."
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.bench, args.repeat, args.quick)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.factor)
+        for name, baseline_value, value, ratio, unit in regressions:
+            print(
+                f"REGRESSION {name}: {_format_value(baseline_value, unit)} -> {_format_value(value, unit)} ({ratio:.2f}x)"
+            )
+        if regressions:
+            return 1
+        print(f"No regressions compared to {args.compare}.")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+from .custom_types import *
+from .utils import DEFAULT_CACHE_DIR, get_executable_version, get_file_hash, run_cmd
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+
+# options of raxml-ng and IQ-Tree whose value is the prefix of all output files
+PREFIX_OPTIONS = ["--prefix", "-pre"]
+# options of raxml-ng and IQ-Tree that set the random seed
+SEED_OPTIONS = ["--seed", "-seed"]
+# raxml-ng modes that do not depend on a random seed
+DETERMINISTIC_OPTIONS = ["--rfdist", "--parse"]
+
+_PREFIX_PLACEHOLDER = "<prefix>"
+_METADATA_FILE = "metadata.json"
+
+
+def _get_option_value(cmd: Command, options: List[str]) -> Optional[Tuple[int, str]]:
+    for i, option in enumerate(cmd[:-1]):
+        if option in options:
+            return i + 1, cmd[i + 1]
+    return None
+
+
+def get_command_key(cmd: Command) -> str:
+    """
+    Returns the cache key of the command: a hash of the version of the executable and the normalised argument list.
+    In the argument list, all existing files (input files and files given as option value, e.g. a partition file
+    given via --model) are replaced by the hash of their content and the output prefix is replaced by a placeholder,
+    so the key does not depend on file names.
+    """
+    normalised = [get_executable_version(cmd[0])]
+    for previous, arg in zip(cmd, cmd[1:]):
+        if previous in PREFIX_OPTIONS:
+            arg = _PREFIX_PLACEHOLDER
+        elif os.path.isfile(arg):
+            arg = get_file_hash(arg)
+        normalised.append(arg)
+
+    return hashlib.sha256(json.dumps(normalised).encode()).hexdigest()
+
+
+def is_cacheable(cmd: Command) -> bool:
+    """
+    Returns whether the results of the command are reproducible: it has an output prefix and either sets
+    the random seed explicitly or runs a raxml-ng mode that does not depend on a random seed.
+    """
+    return _get_option_value(cmd, PREFIX_OPTIONS) is not None and (
+        _get_option_value(cmd, SEED_OPTIONS) is not None or any(option in cmd for option in DETERMINISTIC_OPTIONS)
+    )
+
+
+def _get_file_states(prefix: FilePath) -> Dict[FilePath, Tuple[int, int]]:
+    # modification time and size of all files starting with prefix
+    states = {}
+    for f in glob.glob(glob.escape(prefix) + "*"):
+        if os.path.isfile(f):
+            stat = os.stat(f)
+            states[f] = (stat.st_mtime_ns, stat.st_size)
+    return states
+
+
+class CommandCache:
+    """
+    Content-addressed cache of the output files of raxml-ng and IQ-Tree runs.
+
+    The output files of a command are all files starting with the output prefix (--prefix or -pre)
+    that the command created or changed. If a command with the same cache key (see get_command_key)
+    is run again, the cached output files are restored with the new prefix instead of running the command.
+    Commands that are not reproducible (see is_cacheable) are always run.
+    The least recently used entries are evicted once the cache exceeds max_size bytes.
+    """
+
+    def __init__(self, cache_dir: FilePath = None, max_size: int = 10 << 30):
+        self.cache_dir = cache_dir or os.path.join(DEFAULT_CACHE_DIR, "commands")
+        self.max_size = max_size
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> FilePath:
+        return os.path.join(self.cache_dir, key)
+
+    def _restore(self, key: str, prefix: FilePath, exclude_files: Set[FilePath]) -> bool:
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, _METADATA_FILE)) as f:
+                suffixes = json.load(f)["suffixes"]
+            for suffix in suffixes:
+                if os.path.abspath(prefix + suffix) in exclude_files:
+                    continue
+                shutil.copyfile(os.path.join(entry_dir, suffix), prefix + suffix)
+        except (OSError, ValueError, KeyError):
+            return False
+
+        # the modification time of the entry directory marks the last use for the LRU eviction
+        os.utime(entry_dir)
+        return True
+
+    def _store(self, key: str, prefix: FilePath, output_files: List[FilePath]) -> None:
+        suffixes = [f[len(prefix):] for f in output_files]
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp")
+        try:
+            for output_file, suffix in zip(output_files, suffixes):
+                shutil.copyfile(output_file, os.path.join(tmp_dir, suffix))
+            with open(os.path.join(tmp_dir, _METADATA_FILE), "w") as f:
+                json.dump({"suffixes": suffixes, "created": time.time()}, f)
+
+            entry_dir = self._entry_dir(key)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        self.evict()
+
+    def run(self, cmd: Command, timeout: float = None, exclude_files: List[FilePath] = None) -> bool:
+        """
+        Runs the command unless its output files are cached, in this case the cached files are restored.
+        Commands that are not cacheable (see is_cacheable) are always run.
+
+        Args:
+            exclude_files: Files starting with the output prefix that are written by the caller and
+                must neither be stored nor restored, e.g. a manifest of the caller.
+
+        Returns:
+            True if the output files were restored from the cache, False if the command was run.
+        """
+        if not is_cacheable(cmd):
+            run_cmd(cmd, timeout)
+            return False
+        _, prefix = _get_option_value(cmd, PREFIX_OPTIONS)
+
+        exclude_files = {os.path.abspath(f) for f in exclude_files or []}
+        key = get_command_key(cmd)
+        if self._restore(key, prefix, exclude_files):
+            self.stats["hits"] += 1
+            return True
+
+        self.stats["misses"] += 1
+        states_before = _get_file_states(prefix)
+        run_cmd(cmd, timeout)
+
+        output_files = [
+            f for f, state in _get_file_states(prefix).items()
+            if states_before.get(f) != state and os.path.abspath(f) not in exclude_files
+        ]
+        self._store(key, prefix, output_files)
+        return False
+
+    def _get_entries(self) -> List[Tuple[float, int, FilePath]]:
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self._entry_dir(key)
+            if key.startswith(".") or not os.path.isdir(entry_dir):
+                continue
+            size = sum(e.stat().st_size for e in os.scandir(entry_dir) if e.is_file())
+            entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+        return entries
+
+    def get_size(self) -> int:
+        """
+        Returns the total size of all cached files in bytes.
+        """
+        return sum(size for _, size, _ in self._get_entries())
+
+    def evict(self) -> None:
+        """
+        Deletes the least recently used entries until the cache is no larger than max_size.
+        """
+        entries = sorted(self._get_entries())
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in entries:
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
+            self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        for _, _, entry_dir in self._get_entries():
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+
+def run_cached_cmd(
+    cmd: Command, command_cache: CommandCache = None, timeout: float = None, exclude_files: List[FilePath] = None
+) -> None:
+    """
+    Runs the command using the command_cache, or simply runs the command if command_cache is None.
+    """
+    if command_cache is None:
+        run_cmd(cmd, timeout)
+    else:
+        command_cache.run(cmd, timeout, exclude_files)
@@ -1,5 +1,12 @@
+from .consel_parser import parse_consel_results
 from .custom_types import *
 
+from concurrent.futures import ThreadPoolExecutor
+import os
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+
 
 def get_consel_tree_topology_test_command(
     makermt_executable: Executable,
@@ -7,7 +14,7 @@ def get_consel_tree_topology_test_command(
     catpv_executable: Executable,
     prefix: str,
     **kwargs
-) -> str:
+) -> Tuple[Command, Command, Command]:
 
     additional_settings = []
     for key, value in kwargs.items():
@@ -24,6 +31,7 @@ def get_consel_tree_topology_test_command(
 
     _consel = [
         consel_executable,
+        *additional_settings,
         prefix
     ]
 
@@ -35,3 +43,73 @@ def get_consel_tree_topology_test_command(
     ]
 
     return _makermt, _consel, _catpv
+
+
+def run_consel(
+    sitelh_file: FilePath,
+    makermt_executable: Executable = "makermt",
+    consel_executable: Executable = "consel",
+    catpv_executable: Executable = "catpv",
+    timeout: float = None,
+    **kwargs,
+) -> TreeIndexed[ConselMetrics]:
+    """
+    Runs makermt, consel and catpv for the per-site log-likelihoods in sitelh_file (PUZZLE format)
+    in a scratch directory and parses the catpv output directly, no .consel file is written.
+
+    Args:
+        sitelh_file: Path to the per-site log-likelihood file.
+        timeout: Time limit in seconds for each of the three programs.
+        **kwargs: Additional consel options.
+
+    Returns:
+        The results of get_consel_results.
+
+    Raises:
+        subprocess.CalledProcessError if one of the programs fails.
+    """
+    makermt, consel, catpv = get_consel_tree_topology_test_command(
+        makermt_executable, consel_executable, catpv_executable, prefix="data", **kwargs
+    )
+    # catpv writes the results to stdout, the redirection is replaced by a pipe
+    catpv = catpv[:catpv.index(">")]
+
+    with TemporaryDirectory() as tmpdir:
+        os.symlink(os.path.abspath(sitelh_file), os.path.join(tmpdir, "data.sitelh"))
+        for cmd in (makermt, consel):
+            subprocess.run(cmd, cwd=tmpdir, check=True, timeout=timeout, stdout=subprocess.DEVNULL)
+        output = subprocess.run(
+            catpv, cwd=tmpdir, check=True, timeout=timeout, stdout=subprocess.PIPE
+        ).stdout.decode()
+
+    return parse_consel_results(output.splitlines())
+
+
+def run_consel_batch(
+    sitelh_files: List[FilePath],
+    makermt_executable: Executable = "makermt",
+    consel_executable: Executable = "consel",
+    catpv_executable: Executable = "catpv",
+    threads: int = None,
+    timeout: float = None,
+    **kwargs,
+) -> List[Optional[TreeIndexed[ConselMetrics]]]:
+    """
+    Runs run_consel for all sitelh_files, threads datasets are processed concurrently,
+    each in its own scratch directory.
+
+    Returns:
+        The results for each of the sitelh_files in the same order. The result of a failing dataset is None
+            and the error is printed to stderr.
+    """
+    def _run(sitelh_file):
+        try:
+            return run_consel(
+                sitelh_file, makermt_executable, consel_executable, catpv_executable, timeout, **kwargs
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Error running CONSEL for {sitelh_file}: {e}", file=sys.stderr)
+            return None
+
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1) as executor:
+        return list(executor.map(_run, sitelh_files))
@@ -1,18 +1,23 @@
+from .statstest_results import StatsTestResults
 from .utils import *
 from .regex_constants import *
 
+import numpy as np
 import regex
 
 
-def get_consel_results(consel_file: FilePath) -> TreeIndexed[ConselMetrics]:
+def parse_consel_results(lines: Iterable[str]) -> StatsTestResults:
+    """
+    Parses the lines of the catpv output and returns the results ordered by tree id.
+    """
     id_regex = rf"{blanks}({tree_id_re})"
     res_regex = rf"{blanks}({sign}{float_re})"
     consel_regex = rf"#{id_regex}{id_regex}{res_regex}{res_regex}{res_regex}\s*\|\s*{res_regex}{res_regex}{res_regex}{res_regex}{res_regex}{res_regex}"
 
     unorderd_results = []
 
-    for line in read_file_contents(consel_file):
-        m = regex.match(consel_regex, line)
+    for line in lines:
+        m = regex.match(consel_regex, line.strip())
         if m:
             (
                 rank,
@@ -46,26 +51,25 @@ def get_consel_results(consel_file: FilePath) -> TreeIndexed[ConselMetrics]:
                 )
             )
 
-    ordered_results = sorted(unorderd_results, key=lambda x: x[0])
-    results = []
+    ordered_results = sorted(unorderd_results, key=lambda x: int(x[0]))
+    values = np.array([res for _, res in ordered_results], dtype=object).reshape(-1, 11)
+    rank, treeid, deltaL, pAU, bpMult, bpRELL, bayesPP, pKH, pSH, pWKH, pWSH = values.T
 
-    for _, res in ordered_results:
-        rank, treeid, deltaL, pAU, bpMult, bpRELL, bayesPP, pKH, pSH, pWKH, pWSH = res
-        data = {
-            "deltaL": float(deltaL),
-            "rank": int(rank),
-            "tests": {
-                "bp-RELL": float(bpRELL),
-                "p-KH": float(pKH),
-                "p-SH": float(pSH),
-                "p-WKH": float(pWKH),
-                "p-WSH": float(pWSH),
-                "p-AU": float(pAU),
-                "bp-Mult": float(bpMult),
-                "bayesPosteriorProb": float(bayesPP),
-            },
+    return StatsTestResults(
+        {
+            "deltaL": deltaL.astype(np.float64),
+            "rank": rank.astype(np.int64),
+            "tests/bp-RELL": bpRELL.astype(np.float64),
+            "tests/p-KH": pKH.astype(np.float64),
+            "tests/p-SH": pSH.astype(np.float64),
+            "tests/p-WKH": pWKH.astype(np.float64),
+            "tests/p-WSH": pWSH.astype(np.float64),
+            "tests/p-AU": pAU.astype(np.float64),
+            "tests/bp-Mult": bpMult.astype(np.float64),
+            "tests/bayesPosteriorProb": bayesPP.astype(np.float64),
         }
-        results.append(data)
+    )
 
-    return results
 
+def get_consel_results(consel_file: FilePath) -> StatsTestResults:
+    return parse_consel_results(read_file_contents(consel_file))
@@ -1,4 +1,4 @@
-from typing import Dict, List, Tuple
+from typing import Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
 
 Command = List[str]
 Executable = str
@@ -7,6 +7,7 @@ NewickString = str
 IqTreeMetrics = Dict
 RaxMetrics = Dict
 ConselMetrics = Dict
+AlignmentStatistics = Dict
 Model = str
 
 TreeIndex = int
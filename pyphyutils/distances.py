@@ -0,0 +1,173 @@
+from .custom_types import *
+from .encoded_msa import GAP_CHARS, EncodedMSA
+
+from Bio.Align import substitution_matrices
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+DNA_STATES = "ACGT"
+AA_STATES = "ARNDCQEGHILKMFPSTWYV"
+
+# scored distances use the same substitution matrices as Biopython's DistanceCalculator
+SCORING_MATRICES = {"blastn": "NUC.4.4", "blosum62": "BLOSUM62"}
+DISTANCE_MODELS = ["p", "jc69", *SCORING_MATRICES]
+
+# characters that are skipped for scored distances
+_SKIP_CHARS = GAP_CHARS + "*"
+_SKIP = -1
+_INVALID = -2
+
+# maximum number of cells of the one-hot encoded site tiles
+_TILE_CELLS = 1 << 22
+
+
+def _build_state_lookup_table(states: str, default: int) -> np.ndarray:
+    lut = np.full(256, default, dtype=np.int16)
+    for i, char in enumerate(states):
+        lut[ord(char.upper())] = i
+        lut[ord(char.lower())] = i
+    return lut
+
+
+def _get_model_scores(model: str, data_type: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the state lookup table and the matrix of pairwise state scores for the given model.
+    For p-distances and JC69 the score matrix is the identity over the DNA or AA states,
+    all other characters (gaps, ambiguous characters) are skipped.
+    """
+    if model in ("p", "jc69"):
+        states = DNA_STATES if data_type == "DNA" else AA_STATES
+        return _build_state_lookup_table(states, _SKIP), np.eye(len(states))
+
+    if model in SCORING_MATRICES:
+        matrix = substitution_matrices.load(SCORING_MATRICES[model])
+        lut = _build_state_lookup_table(matrix.alphabet, _INVALID)
+        for char in _SKIP_CHARS:
+            lut[ord(char)] = _SKIP
+        return lut, np.array(matrix, dtype=np.float64)
+
+    raise ValueError(
+        f"Distance model not supported: {model}. Available models: {', '.join(DISTANCE_MODELS)}"
+    )
+
+
+def _get_tile_sums(
+    codes: np.ndarray, weights: np.ndarray, scores: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the weighted score sums and self score sums over all sites of the tile.
+
+    Args:
+        codes: int16 array of shape (taxa, sites) containing the state index of each character, negative for skipped characters.
+        weights: Weight of each site.
+        scores: Matrix of pairwise state scores.
+
+    Returns:
+        Two float arrays of shape (taxa, taxa): score_sums[i, j] is the sum of scores[a_i, a_j] and
+        self_score_sums[i, j] the sum of scores[a_i, a_i] over all sites where neither a_i nor a_j is skipped.
+    """
+    num_taxa, num_sites = codes.shape
+    num_states = len(scores)
+
+    valid = codes >= 0
+    states = np.where(valid, codes, 0)
+    weighted_valid = valid * weights
+
+    one_hot = (states[:, :, np.newaxis] == np.arange(num_states)) & valid[:, :, np.newaxis]
+    # weighted_scores[j, s, k] = weight_s * scores[k, a_js]
+    weighted_scores = scores.T[states] * weighted_valid[:, :, np.newaxis]
+
+    score_sums = one_hot.reshape(num_taxa, -1).astype(np.float64) @ weighted_scores.reshape(num_taxa, -1).T
+    self_scores = np.diag(scores)[states] * weighted_valid
+    self_score_sums = self_scores @ valid.T.astype(np.float64)
+
+    return score_sums, self_score_sums
+
+
+def _get_score_sums(
+    codes: np.ndarray, weights: np.ndarray, scores: np.ndarray, threads: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    num_taxa, num_sites = codes.shape
+    tile_size = max(1, _TILE_CELLS // max(1, num_taxa * len(scores)))
+    tile_starts = list(range(0, num_sites, tile_size))
+
+    def _sum_tiles(starts):
+        score_sums = np.zeros((num_taxa, num_taxa))
+        self_score_sums = np.zeros((num_taxa, num_taxa))
+        for start in starts:
+            end = start + tile_size
+            tile_score_sums, tile_self_score_sums = _get_tile_sums(codes[:, start:end], weights[start:end], scores)
+            score_sums += tile_score_sums
+            self_score_sums += tile_self_score_sums
+        return score_sums, self_score_sums
+
+    if threads > 1 and len(tile_starts) > 1:
+        # NumPy releases the GIL during the tile computations, so the tiles can be processed in threads
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            partial_sums = list(executor.map(_sum_tiles, [tile_starts[i::threads] for i in range(threads)]))
+    else:
+        partial_sums = [_sum_tiles(tile_starts)]
+
+    score_sums = sum(s for s, _ in partial_sums)
+    self_score_sums = sum(s for _, s in partial_sums)
+    return score_sums, self_score_sums
+
+
+def get_distance_matrix(msa, model: str = "p", data_type: str = None, threads: int = 1) -> np.ndarray:
+    """
+    Computes the pairwise distance matrix of all sequences in the msa.
+
+    The computation runs on the unique site patterns of the encoded alignment.
+    The patterns are processed in tiles of one-hot encoded sites, such that each tile
+    reduces to a single matrix multiplication.
+
+    Args:
+        msa: The alignment, either an EncodedMSA or a Biopython MultipleSeqAlignment.
+        model: Distance model, one of
+            "p": proportion of differing sites, only considering sites where both sequences have a DNA/AA state
+            "jc69": Jukes-Cantor corrected p-distance (for AA data the equal-rates correction with 20 states)
+            "blastn"/"blosum62": scored distance 1 - score / max_score as computed by Biopython's DistanceCalculator
+        data_type: "DNA" or "AA", defaults to the data type of the msa.
+        threads: Number of threads used to process the tiles.
+
+    Returns:
+        Symmetric float array of shape (taxa, taxa). The distance of sequences without comparable sites
+        is nan for "p" and "jc69" and 1 for the scored distances. Saturated JC69 distances are inf.
+
+    Raises:
+        ValueError if the model is not supported or the alignment contains characters
+            not contained in the scoring matrix.
+    """
+    msa = EncodedMSA.from_msa(msa)
+    data_type = data_type or msa.data_type
+
+    lut, scores = _get_model_scores(model, data_type)
+
+    invalid_bytes = np.flatnonzero((lut == _INVALID) & (msa.get_byte_counts() > 0))
+    if invalid_bytes.size > 0:
+        raise ValueError(
+            f"Bad letter(s) {[chr(b) for b in invalid_bytes]} in alignment for distance model {model}."
+        )
+
+    patterns, weights, _ = msa.get_site_patterns()
+    codes = lut[patterns]
+
+    score_sums, self_score_sums = _get_score_sums(codes, weights.astype(np.float64), scores, threads)
+    max_scores = np.maximum(self_score_sums, self_score_sums.T)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distances = 1 - score_sums / max_scores
+
+    if model in SCORING_MATRICES:
+        distances[max_scores == 0] = 1
+    else:
+        distances[max_scores == 0] = np.nan
+
+    if model == "jc69":
+        b = 1 - 1 / len(scores)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distances = np.where(distances >= b, np.inf, -b * np.log(1 - distances / b))
+
+    np.fill_diagonal(distances, 0)
+    return distances
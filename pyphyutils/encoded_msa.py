@@ -0,0 +1,211 @@
+from .custom_types import *
+
+from Bio.Align import MultipleSeqAlignment
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+import numpy as np
+
+
+STATE_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ!\"#$%&'()*+,/:;<=>@[\\]^_{|}~"
+GAP_CHARS = "-?."
+DNA_CHARS = "ACTG"
+
+# Every byte of an alignment is mapped to a code in [0, NUM_CODES):
+# the index of the (uppercased) character in STATE_CHARS, OTHER_CODE for characters that are
+# neither a state nor a gap, and GAP_CODE for all characters in GAP_CHARS.
+NUM_STATES = len(STATE_CHARS)
+OTHER_CODE = NUM_STATES
+GAP_CODE = NUM_STATES + 1
+NUM_CODES = NUM_STATES + 2
+
+# maximum number of matrix cells that are expanded to intp at once during blocked computations
+_BLOCK_CELLS = 1 << 22
+
+# odd multiplier of the polynomial rolling hash over the taxa of a site
+_HASH_MULTIPLIER = np.uint64(0x100000001B3)
+
+
+def _build_code_lookup_table() -> np.ndarray:
+    lut = np.full(256, OTHER_CODE, dtype=np.uint8)
+    for i, char in enumerate(STATE_CHARS):
+        lut[ord(char)] = i
+        lut[ord(char.lower())] = i
+    for char in GAP_CHARS:
+        lut[ord(char)] = GAP_CODE
+    return lut
+
+
+CODE_LOOKUP = _build_code_lookup_table()
+
+
+class EncodedMSA:
+    """
+    Multiple sequence alignment stored as uint8 matrix of shape (taxa, sites).
+    Each cell holds the ASCII value of the respective character, CODE_LOOKUP maps these to state codes.
+    """
+
+    def __init__(self, matrix: np.ndarray, taxa: List[str], data_type: str = "DNA"):
+        if matrix.ndim != 2 or matrix.dtype != np.uint8:
+            raise ValueError(
+                f"The alignment matrix needs to be a 2D uint8 array, got {matrix.ndim}D {matrix.dtype}."
+            )
+        if len(taxa) != matrix.shape[0]:
+            raise ValueError(
+                f"Number of taxon names ({len(taxa)}) does not match the number of sequences ({matrix.shape[0]})."
+            )
+        self.matrix = matrix
+        self.taxa = list(taxa)
+        self.data_type = data_type
+        self._site_patterns = None
+        self._taxon_byte_counts = None
+
+    @classmethod
+    def from_biopython(cls, msa: MultipleSeqAlignment, data_type: str = "DNA") -> "EncodedMSA":
+        sequences = [str(record.seq).encode("ascii", errors="replace") for record in msa]
+        num_sites = msa.get_alignment_length()
+        matrix = np.frombuffer(b"".join(sequences), dtype=np.uint8).reshape(len(sequences), num_sites)
+        return cls(matrix.copy(), [record.id for record in msa], data_type)
+
+    @classmethod
+    def from_msa(cls, msa, data_type: str = "DNA") -> "EncodedMSA":
+        """
+        Returns the given msa as EncodedMSA. Biopython alignments are encoded, EncodedMSA objects are returned as is.
+        """
+        if isinstance(msa, cls):
+            return msa
+        return cls.from_biopython(msa, data_type)
+
+    def to_biopython(self) -> MultipleSeqAlignment:
+        records = [
+            SeqRecord(Seq(row.tobytes().decode("ascii")), id=taxon, description="")
+            for taxon, row in zip(self.taxa, self.matrix)
+        ]
+        return MultipleSeqAlignment(records)
+
+    def __len__(self) -> int:
+        return self.num_taxa
+
+    @property
+    def num_taxa(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def num_sites(self) -> int:
+        return self.matrix.shape[1]
+
+    def get_alignment_length(self) -> int:
+        return self.num_sites
+
+    def column_blocks(self, max_cells: int = _BLOCK_CELLS):
+        """
+        Yields tuples (start, block) where block is the view matrix[:, start:start + block_size].
+        The block size is chosen such that each block contains at most max_cells cells.
+        """
+        block_size = max(1, max_cells // max(1, self.num_taxa))
+        for start in range(0, self.num_sites, block_size):
+            yield start, self.matrix[:, start:start + block_size]
+
+    def row_blocks(self, max_cells: int = _BLOCK_CELLS):
+        """
+        Yields tuples (start, block) where block is the view matrix[start:start + block_size].
+        The block size is chosen such that each block contains at most max_cells cells.
+        """
+        block_size = max(1, max_cells // max(1, self.num_sites))
+        for start in range(0, self.num_taxa, block_size):
+            yield start, self.matrix[start:start + block_size]
+
+    def get_site_code_counts(self) -> np.ndarray:
+        """
+        Returns an int64 array of shape (sites, NUM_CODES) with the number of occurrences of each code per site.
+        """
+        counts = np.empty((self.num_sites, NUM_CODES), dtype=np.int64)
+        for start, block in self.column_blocks():
+            block_size = block.shape[1]
+            codes = CODE_LOOKUP[block].astype(np.intp)
+            # shift the codes of each column into a separate range of bins
+            codes += np.arange(block_size, dtype=np.intp) * NUM_CODES
+            counts[start:start + block_size] = np.bincount(
+                codes.ravel(), minlength=block_size * NUM_CODES
+            ).reshape(block_size, NUM_CODES)
+        return counts
+
+    def get_taxon_byte_counts(self) -> np.ndarray:
+        """
+        Returns an int64 array of shape (taxa, 256) with the number of occurrences of each raw byte value per taxon.
+        The counts are computed in a single pass over the matrix and cached.
+        """
+        if self._taxon_byte_counts is None:
+            counts = np.empty((self.num_taxa, 256), dtype=np.int64)
+            for start, block in self.row_blocks():
+                block_size = block.shape[0]
+                codes = block.astype(np.intp)
+                # shift the bytes of each taxon into a separate range of bins
+                codes += (np.arange(block_size, dtype=np.intp) * 256)[:, np.newaxis]
+                counts[start:start + block_size] = np.bincount(
+                    codes.ravel(), minlength=block_size * 256
+                ).reshape(block_size, 256)
+            self._taxon_byte_counts = counts
+        return self._taxon_byte_counts
+
+    def get_byte_counts(self) -> np.ndarray:
+        """
+        Returns an int64 array of length 256 with the number of occurrences of each raw byte value in the alignment.
+        """
+        return self.get_taxon_byte_counts().sum(axis=0)
+
+    def _hash_sites(self) -> np.ndarray:
+        hashes = np.zeros(self.num_sites, dtype=np.uint64)
+        for row in self.matrix:
+            hashes *= _HASH_MULTIPLIER
+            hashes += row
+        return hashes
+
+    def _sites_match_patterns(self, pattern_sites: np.ndarray, site_indices: np.ndarray) -> bool:
+        for start, block in self.column_blocks():
+            representatives = pattern_sites[site_indices[start:start + block.shape[1]]]
+            if not np.array_equal(block, self.matrix[:, representatives]):
+                return False
+        return True
+
+    def _get_unique_sites(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Deduplicates the sites based on a 64-bit hash of each site.
+        In case of a hash collision, the sites are deduplicated using a fixed-width byte record per site.
+        """
+        _, first_sites, site_indices, weights = np.unique(
+            self._hash_sites(), return_index=True, return_inverse=True, return_counts=True
+        )
+        site_indices = site_indices.ravel()
+
+        if not self._sites_match_patterns(first_sites, site_indices):
+            sites = np.ascontiguousarray(self.matrix.T)
+            records = sites.view(np.dtype((np.void, max(1, self.num_taxa)))).ravel()
+            _, first_sites, site_indices, weights = np.unique(
+                records, return_index=True, return_inverse=True, return_counts=True
+            )
+            site_indices = site_indices.ravel()
+
+        return first_sites, site_indices, weights
+
+    def get_site_patterns(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the unique site patterns of the alignment. The result is computed once and cached.
+
+        Returns:
+            A tuple (patterns, weights, site_indices):
+            patterns is a uint8 array of shape (taxa, patterns) containing the unique sites in order of
+            their first occurrence, weights contains the number of occurrences of each pattern and
+            site_indices maps each site of the alignment to the index of its pattern.
+        """
+        if self._site_patterns is None:
+            first_sites, site_indices, weights = self._get_unique_sites()
+
+            # order the patterns by their first occurrence in the alignment
+            order = np.argsort(first_sites, kind="stable")
+            rank = np.empty_like(order)
+            rank[order] = np.arange(len(order))
+
+            patterns = np.ascontiguousarray(self.matrix[:, first_sites[order]])
+            self._site_patterns = (patterns, weights[order].astype(np.int64), rank[site_indices])
+
+        return self._site_patterns
@@ -57,6 +57,20 @@ class IQTree:
         )
         return base_command + ["-te", treesfile]
 
+    def get_trees_eval_cmd(
+        self,
+        msa_file: FilePath,
+        model: Model,
+        treesfile: FilePath,
+        prefix: str,
+        **kwargs,
+    ) -> Command:
+        # evaluates all trees of the treesfile in one run (-te only evaluates a single tree)
+        base_command = self._base_cmd(
+            msa_file=msa_file, model=model, prefix=prefix, **kwargs
+        )
+        return base_command + ["-z", treesfile, "-n", "0"]
+
     def get_tree_topology_test_cmd(
         self,
         msa_file: FilePath,
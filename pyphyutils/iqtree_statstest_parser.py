@@ -1,107 +1,143 @@
 from .custom_types import *
-from .regex_constants import *
+from .statstest_results import StatsTestResults
 from .utils import *
-import regex
-import warnings
-
-
-def _get_relevant_section(input_file: FilePath) -> str:
-    content = read_file_contents(input_file)
 
-    # now let's find the relevant lines
-    # the relevant lines are only between the start and end string
-    start_str = "USER TREES"
-    end_str = "TIME STAMP"
-    start = 0
-    end = 0
+import numpy as np
+import warnings
 
-    for i, line in enumerate(content):
-        if start_str in line:
-            start = i
-        if end_str in line:
-            end = i
 
-    if start == end:
+def _get_entry(tokens: List[str], test_names: List[str], input_file: FilePath) -> IqTreeMetrics:
+    # a table entry in the .iqtree file looks for example like this:
+    # 5 -5708.931281 1.7785e-06  0.0051 -  0.498 +  0.987 +  0.498 +  0.987 +      0.05 +    0.453 +
+    # so after tree id, logL and deltaL, each test result consists of the score and the significance sign
+    if len(tokens) != 3 + 2 * len(test_names):
         raise ValueError(
-            f"The section between START_STRING {start_str} and END_STRING {end_str} is empty. Please check the input file {input_file}."
+            f"The table entry '{' '.join(tokens)}' in {input_file} does not contain results for the tests {test_names}."
         )
 
-    return content[start:end]
+    data = {}
+    data["logL"] = float(tokens[1])
+    data["deltaL"] = float(tokens[2])
+    data["tests"] = {}
 
+    num_passed = 0
 
-def _get_names_of_performed_tests(table_section: str) -> List[str]:
-    """
-    Returns the names of the performed iqtree tests as stated in the table header.
-
-    Args:
-        table_section: String containing the iqtree test result table.
+    for i, test in enumerate(test_names):
+        score = tokens[3 + 2 * i]
+        significant = tokens[4 + 2 * i]
+        data["tests"][test] = {}
+        data["tests"][test]["score"] = float(score)
+        data["tests"][test]["significant"] = True if significant == "+" else False
 
-    Returns:
-        A list of strings, each string is the name of a performed statistical test.
+        if data["tests"][test]["significant"]:
+            num_passed += 1
 
-    Raises:
-        ValueError if the section does not contain a table header matching the defined regex.
-    """
-    # table header is of form:
-    # Tree      logL    deltaL  bp-RELL    p-KH     p-SH    p-WKH    p-WSH       c-ELW       p-AU
-    table_header = rf"Tree{blanks}logL{blanks}deltaL{blanks}(?:({stat_test_name})\s*)*"
-    table_header_re = regex.compile(table_header)
+    data["plausible"] = num_passed == len(data["tests"].keys())
+    return data
 
-    test_names = []
 
-    for line in table_section:
-        line = line.strip()
-        m = regex.match(table_header_re, line)
-        if m:
-            # m captures 2 groups: the first is Tree, logL, deltaL, the second are the tests
-            test_names = m.captures(1)
+def _iter_iqtree_table(iqtree_file: FilePath) -> Iterator[Tuple[List[str], List[str]]]:
+    """
+    Streams the file once with a small state machine: each USER TREES section starts a new table,
+    the names of the performed tests are read from the table header
+    (Tree      logL    deltaL  bp-RELL    p-KH     p-SH    p-WKH    p-WSH       c-ELW       p-AU)
+    and the whitespace separated tokens of each table entry are collected until the TIME STAMP section starts.
+    A file may contain multiple USER TREES sections (e.g. after a rerun), only the last table is kept and
+    its entries are yielded together with the test names at the end of the file.
+    Table entries with an unexpected number of values are skipped with a warning.
+    """
+    start_str = "USER TREES"
+    end_str = "TIME STAMP"
 
-    if not test_names:
+    found_section = False
+    in_section = False
+    test_names = None
+    rows = []
+    skipped_rows = []
+
+    with open(iqtree_file) as f:
+        for line in f:
+            if start_str in line:
+                found_section = True
+                in_section = True
+                test_names = None
+                rows = []
+                skipped_rows = []
+                continue
+            if not in_section:
+                continue
+            if end_str in line:
+                in_section = False
+                continue
+
+            tokens = line.split()
+            if not tokens:
+                continue
+
+            if tokens[:3] == ["Tree", "logL", "deltaL"]:
+                test_names = tokens[3:]
+            elif test_names is not None and tokens[0].isdigit():
+                if len(tokens) == 3 + 2 * len(test_names):
+                    rows.append(tokens)
+                else:
+                    skipped_rows.append(tokens)
+
+    if not found_section:
+        raise ValueError(
+            f"The given input file {iqtree_file} does not contain the section START_STRING {start_str}."
+        )
+    for tokens in skipped_rows:
+        warnings.warn(
+            f"Skipping the table entry '{' '.join(tokens)}' in {iqtree_file}, "
+            f"it does not contain results for the tests {test_names}."
+        )
+    if not rows:
         raise ValueError(
-            "No line in the given section matches the regex. Compare the regex and the given section. Maybe the format has changed."
+            f"The section between START_STRING {start_str} and END_STRING {end_str} does not contain a test result table. "
+            f"Please check the input file {iqtree_file}. Maybe the format has changed."
         )
-    return test_names
 
+    for tokens in rows:
+        yield tokens, test_names
 
-def _get_cleaned_table_entries(
-    table_section: str,
-) -> List[Tuple]:
+
+def iter_iqtree_results(iqtree_file: FilePath) -> Iterator[IqTreeMetrics]:
     """
-    Returns the content of the table in the given section.
+    Yields the iqtree test results for each tree in the last test result table of the given iqtree test summary file.
 
     Args:
-        table_section: String containing the iqtree test result table.
+        iqtree_file: Path to the iqtree test summary file.
 
-    Returns:
-        A list of tuples, each containing the tree_id, llh, deltaL and a list of test results.
+    Yields:
+        A dict per tree containing the llh, deltaL, all results of the performed iqtree tests
+            and whether the tree passed all tests.
 
     Raises:
-        ValueError if the section does not contain table entries matching the defined regex.
+        ValueError if the file does not contain the USER TREES section, the table header or any table entry.
     """
-    # a table entry in the .iqtree file looks for example like this:
-    # 5 -5708.931281 1.7785e-06  0.0051 -  0.498 +  0.987 +  0.498 +  0.987 +      0.05 +    0.453 +
-    table_entry = rf"({tree_id_re}){blanks}({llh_re}){blanks}({deltaL_re}){blanks}(?:({test_result_re})\s*)*"
-    table_entry_re = regex.compile(table_entry)
-
-    entries = []
-    for line in table_section:
-        line = line.strip()
-        # match the line against the regex defined above for a table entry
-        m = regex.match(table_entry_re, line)
-        if m:
-            # if a match was found: capture the results in variables
-            tree_id, llh, deltaL, result_group = m.groups()
-            # to capture all test results individually we have to explicitly unpack it
-            test_results = m.captures(4)
-            entry = (tree_id, llh, deltaL, test_results)
-            entries.append(entry)
-
-    if not entries:
-        raise ValueError(
-            "No line in the given section matches the regex. Compare the regex and the given section. Maybe the format has changed."
-        )
+    for tokens, test_names in _iter_iqtree_table(iqtree_file):
+        yield _get_entry(tokens, test_names, iqtree_file)
+
 
-    return entries
+def _get_iqtree_result_columns(iqtree_file: FilePath) -> StatsTestResults:
+    rows = []
+    test_names = []
+    for tokens, test_names in _iter_iqtree_table(iqtree_file):
+        rows.append(tokens[1:])
+
+    values = np.array(rows, dtype=object)
+    significant = values[:, 3::2] == "+"
+
+    columns = {
+        "logL": values[:, 0].astype(np.float64),
+        "deltaL": values[:, 1].astype(np.float64),
+    }
+    for i, test in enumerate(test_names):
+        columns[f"tests/{test}/score"] = values[:, 2 + 2 * i].astype(np.float64)
+        columns[f"tests/{test}/significant"] = significant[:, i]
+    columns["plausible"] = significant.all(axis=1)
+
+    return StatsTestResults(columns)
 
 
 def _get_default_entry() -> IqTreeMetrics:
@@ -120,51 +156,21 @@ def _get_default_entry() -> IqTreeMetrics:
     }
 
 
-def get_iqtree_results(iqtree_file: FilePath) -> TreeIndexed[IqTreeMetrics]:
+def get_iqtree_results(iqtree_file: FilePath) -> StatsTestResults:
     """
-    Returns a list of dicts, each dict contains the iqtree test results for the respective tree.
+    Returns the iqtree test results for each tree.
 
     Args:
         iqtree_file: Path to the iqtree test summary file.
 
     Returns:
-        A list of dicts. Each dict contains the tree_id, llh, deltaL and all results of the performed
-            iqtree tests.
+        The results with one column per metric (logL, deltaL, score and significance of each test, plausible).
+            Indexing the results returns a dict per tree containing the llh, deltaL and all results of
+            the performed iqtree tests.
     """
     try:
-        section = _get_relevant_section(iqtree_file)
-        entries = _get_cleaned_table_entries(section)
-        test_names = _get_names_of_performed_tests(section)
+        return _get_iqtree_result_columns(iqtree_file)
     except ValueError as e:
         warnings.warn(str(e))
         warnings.warn("Falling back to default case.")
-        return [_get_default_entry()]
-
-    results = []
-
-    for tree_id, llh, deltaL, test_results in entries:
-        assert len(test_names) == len(test_results)
-
-        data = {}
-        data["logL"] = float(llh)
-        data["deltaL"] = float(deltaL)
-        data["tests"] = {}
-
-        num_passed = 0
-
-        for i, test in enumerate(test_names):
-            test_result = test_results[i]
-            score, significant = test_result.split(" ")
-            score = score.strip()
-            significant = significant.strip()
-            data["tests"][test] = {}
-            data["tests"][test]["score"] = float(score)
-            data["tests"][test]["significant"] = True if significant == "+" else False
-
-            if data["tests"][test]["significant"]:
-                num_passed += 1
-
-        data["plausible"] = num_passed == len(data["tests"].keys())
-
-        results.append(data)
-    return results
+        return StatsTestResults.from_dicts([_get_default_entry()])
@@ -1,21 +1,71 @@
+from .command_cache import CommandCache, get_command_key, run_cached_cmd
 from .custom_types import *
 from .iqtree import IQTree
-from .iqtree_statstest_parser import get_iqtree_results
+from .iqtree_statstest_parser import get_iqtree_results, iter_iqtree_results
 from .raxmlng import RAxMLNG
 from .raxmlng_parser import get_raxmlng_num_unique_topos
-from .utils import run_cmd, read_file_contents, write_trees_to_file
+from .rfdist import get_topology_clusters, get_topology_hash
+from .statstest_results import StatsTestResults
+from .utils import get_file_hash, read_file_contents, tukeys_fence, write_trees_to_file
 
+import json
+import math
+import os
 from tempfile import TemporaryDirectory
 
 
-def get_iqtree_results_for_tree(iqtree_results: TreeIndexed[IqTreeMetrics], tree: NewickString, clusters: List):
-    # returns the results for this eval_tree_id as well as the cluster ID
+def get_topology_index(
+    iqtree_results: TreeIndexed[IqTreeMetrics], clusters: List
+) -> Dict[str, Tuple[IqTreeMetrics, int]]:
+    """
+    Returns a dict mapping the canonical topology hash of each tree in the clusters
+    to the IQ-Tree results and the ID of the respective cluster.
+    Build this index once and pass it to get_iqtree_results_for_tree when looking up many trees.
+    """
+    topology_index = {}
     for i, cluster in enumerate(clusters):
-        if tree.strip() in cluster:
-            return iqtree_results[i], i
+        for tree in cluster:
+            topology_index.setdefault(get_topology_hash(tree), (iqtree_results[i], i))
+    return topology_index
 
-    raise ValueError("This newick_string belongs to no cluster. newick_str: ", tree[:10])
 
+def get_iqtree_results_for_tree(
+    iqtree_results: TreeIndexed[IqTreeMetrics],
+    tree: NewickString,
+    clusters: List,
+    topology_index: Dict[str, Tuple[IqTreeMetrics, int]] = None,
+):
+    """
+    Returns the IQ-Tree results for the given tree as well as the cluster ID.
+    The tree is matched by topology, so branch lengths, the order of the children and the rooting may differ
+    from the trees in the clusters.
+
+    Args:
+        iqtree_results: IQ-Tree results, one entry per cluster.
+        tree: Newick string of the tree.
+        clusters: List of sets of newick strings with identical topology.
+        topology_index: Index as returned by get_topology_index. If not given, the tree is first looked up
+            by its newick string and then compared to the topology of one tree per cluster.
+
+    Raises:
+        ValueError if the topology of the tree belongs to no cluster.
+    """
+    tree = tree.strip()
+    if topology_index is None:
+        for i, cluster in enumerate(clusters):
+            if tree in cluster:
+                return iqtree_results[i], i
+
+    topology_hash = get_topology_hash(tree)
+
+    if topology_index is None:
+        for i, cluster in enumerate(clusters):
+            if cluster and get_topology_hash(next(iter(cluster))) == topology_hash:
+                return iqtree_results[i], i
+    elif topology_hash in topology_index:
+        return topology_index[topology_hash]
+
+    raise ValueError("This newick_string belongs to no cluster. newick_str: ", tree[:10])
 
 
 def get_rfdist_clusters(log_path, all_trees):
@@ -44,35 +94,66 @@ def get_rfdist_clusters(log_path, all_trees):
     return clusters
 
 
-def filter_tree_topologies(
+def _filter_tree_topologies_raxmlng(
     unfiltered_trees_file: FilePath,
+    tree_strings: List[NewickString],
     raxmlng: RAxMLNG,
-) -> Tuple[List[NewickString], List]:
-    tree_strings = read_file_contents(unfiltered_trees_file)
-    num_trees = len(tree_strings)
+    command_cache: CommandCache = None,
+) -> List:
+    with TemporaryDirectory() as tmpdir:
+        raxmlng_prefix = tmpdir + "raxmlng_rfdist"
+        raxmlng_rfdist_cmd = raxmlng.get_rfdist_cmd(
+            trees_file=unfiltered_trees_file, prefix=raxmlng_prefix
+        )
+        run_cached_cmd(raxmlng_rfdist_cmd, command_cache)
+        raxmlng_log_file = raxmlng_prefix + ".raxml.log"
+        num_topos = get_raxmlng_num_unique_topos(raxmlng_log_file)
 
-    if num_trees > 1:
-        with TemporaryDirectory() as tmpdir:
-            raxmlng_prefix = tmpdir + "raxmlng_rfdist"
-            raxmlng_rfdist_cmd = raxmlng.get_rfdist_cmd(
-                trees_file=unfiltered_trees_file, prefix=raxmlng_prefix
-            )
-            run_cmd(raxmlng_rfdist_cmd)
-            raxmlng_log_file = raxmlng_prefix + ".raxml.log"
-            num_topos = get_raxmlng_num_unique_topos(raxmlng_log_file)
+        if num_topos > 1:
+            clusters = get_rfdist_clusters(raxmlng_log_file, tree_strings)
 
-            if num_topos > 1:
-                clusters = get_rfdist_clusters(raxmlng_log_file, tree_strings)
+            assert len(clusters) == num_topos
+        else:
+            clusters = [set(tree_strings)]
+
+    return clusters
 
-                assert len(clusters) == num_topos
-            else:
-                clusters = [set(tree_strings)]
 
+def filter_tree_topologies(
+    unfiltered_trees_file: FilePath,
+    raxmlng: RAxMLNG = None,
+    use_raxmlng: bool = False,
+    command_cache: CommandCache = None,
+) -> Tuple[List[NewickString], List]:
+    """
+    Groups the trees in unfiltered_trees_file by topology.
+
+    By default, the topologies are compared using the built-in RF distance engine.
+    Set use_raxmlng to compute the clusters using raxml-ng --rfdist instead, this requires
+    the adapted version of RAxML-NG that is available here: https://github.com/tschuelia/raxml-ng
+    If a command_cache is given, the raxml-ng results are reused for unchanged input trees.
+
+    Returns:
+        A tuple (filtered_trees, clusters): clusters is a list of sets of newick strings with identical topology,
+        filtered_trees contains one representative of each cluster.
+    """
+    tree_strings = [t for t in read_file_contents(unfiltered_trees_file) if t]
+    num_trees = len(tree_strings)
+
+    if num_trees > 1 and use_raxmlng:
+        if raxmlng is None:
+            raise ValueError("Filtering tree topologies using raxml-ng requires a RAxMLNG object.")
+        clusters = _filter_tree_topologies_raxmlng(unfiltered_trees_file, tree_strings, raxmlng, command_cache)
+        # for each cluster: keep only one tree as representative of the cluster
+        filtered_trees = [next(iter(cluster)) for cluster in clusters]
+    elif num_trees > 1:
+        index_clusters = get_topology_clusters(tree_strings)
+        clusters = [set(tree_strings[i] for i in cluster) for cluster in index_clusters]
+        # for each cluster: keep the first tree as representative of the cluster
+        filtered_trees = [tree_strings[cluster[0]] for cluster in index_clusters]
     else:
         clusters = [set(tree_strings)]
-
-    # for each cluster: keep only one tree as representative of the cluster
-    filtered_trees = [next(iter(cluster)) for cluster in clusters]
+        filtered_trees = [next(iter(cluster)) for cluster in clusters]
 
     # sanity checks
     assert sum([len(s) for s in clusters]) <= num_trees
@@ -80,10 +161,161 @@ def filter_tree_topologies(
     return filtered_trees, clusters
 
 
+def _get_screened_entry(llh: float, test_names: List[str]) -> IqTreeMetrics:
+    # entry of a tree that was screened out before the topology tests: it fails all tests,
+    # its deltaL is set once the best log-likelihood of all trees is known
+    return {
+        "logL": llh,
+        "deltaL": None,
+        "tests": {test: {"score": 0.0, "significant": False} for test in test_names},
+        "plausible": False,
+    }
+
+
+# files next to the output prefix that are written by IQTreeTopologyTest itself and not by IQ-Tree
+_BOOKKEEPING_SUFFIXES = [".manifest.json", ".manifest.json.tmp", ".filtered.trees", ".clusters.json", ".plausible.trees"]
+
+
+def _get_bookkeeping_files(prefix: str) -> List[FilePath]:
+    return [prefix + suffix for suffix in _BOOKKEEPING_SUFFIXES]
+
+
+def _read_manifest(manifest_file: FilePath) -> Dict:
+    try:
+        with open(manifest_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(manifest_file: FilePath, manifest: Dict) -> None:
+    tmp_file = manifest_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_file, manifest_file)
+
+
 class IQTreeTopologyTest:
-    def __init__(self, iqtree_executable: Executable, raxmlng_executable: Executable):
+    """
+    Filters the unique topologies of a set of trees and runs the IQ-Tree topology tests on them.
+
+    All intermediate results are stored next to the output prefix:
+    prefix.filtered.trees (one tree per topology), prefix.clusters.json (the trees of each topology)
+    and prefix.manifest.json (the finished stages and the hash of their inputs).
+    The optional likelihood prefilter stage additionally writes prefix.eval.* and prefix.plausible.trees.
+    If perform_topology_tests is called again with the same prefix, finished stages with unchanged inputs
+    are skipped and interrupted IQ-Tree runs resume from the IQ-Tree checkpoint (prefix.ckp.gz).
+    """
+
+    def __init__(
+        self,
+        iqtree_executable: Executable,
+        raxmlng_executable: Executable = "raxml-ng",
+        use_raxmlng_rfdist: bool = False,
+        command_cache: CommandCache = None,
+    ):
         self.iqtree = IQTree(iqtree_executable)
         self.raxmlng = RAxMLNG(raxmlng_executable)
+        self.use_raxmlng_rfdist = use_raxmlng_rfdist
+        self.command_cache = command_cache
+
+    def _filter_tree_topologies(
+        self, unfiltered_trees_file: FilePath, prefix: str, manifest: Dict, resume: bool
+    ) -> Tuple[List[NewickString], List]:
+        filtered_trees_file = prefix + ".filtered.trees"
+        clusters_file = prefix + ".clusters.json"
+        input_hash = f"{get_file_hash(unfiltered_trees_file)}:{self.use_raxmlng_rfdist}"
+
+        stage = manifest.get("filter_tree_topologies", {})
+        if resume and stage.get("input_hash") == input_hash:
+            try:
+                with open(clusters_file) as f:
+                    clusters = [set(cluster) for cluster in json.load(f)]
+                filtered_trees = read_file_contents(filtered_trees_file)
+                if len(filtered_trees) == len(clusters):
+                    return filtered_trees, clusters
+            except (OSError, ValueError):
+                pass
+
+        filtered_trees, clusters = filter_tree_topologies(
+            unfiltered_trees_file=unfiltered_trees_file,
+            raxmlng=self.raxmlng,
+            use_raxmlng=self.use_raxmlng_rfdist,
+            command_cache=self.command_cache,
+        )
+
+        write_trees_to_file(file_path=filtered_trees_file, trees=filtered_trees)
+        with open(clusters_file, "w") as f:
+            json.dump([sorted(cluster) for cluster in clusters], f)
+
+        manifest["filter_tree_topologies"] = {"input_hash": input_hash}
+        manifest.pop("tree_evaluation", None)
+        manifest.pop("topology_tests", None)
+        return filtered_trees, clusters
+
+    def _run_stage(
+        self,
+        stage_name: str,
+        cmd: Command,
+        manifest: Dict,
+        manifest_file: FilePath,
+        output_file: FilePath,
+        exclude_files: List[FilePath],
+    ) -> None:
+        input_hash = get_command_key(cmd)
+        stage = manifest.get(stage_name, {})
+        if stage.get("input_hash") == input_hash and stage.get("finished") and os.path.isfile(output_file):
+            return
+
+        if stage.get("input_hash") != input_hash and "-redo" not in cmd:
+            # the IQ-Tree checkpoint belongs to a run with different inputs
+            cmd = cmd + ["-redo"]
+
+        manifest[stage_name] = {"input_hash": input_hash, "finished": False}
+        _write_manifest(manifest_file, manifest)
+
+        run_cached_cmd(cmd, self.command_cache, exclude_files=exclude_files)
+
+        manifest[stage_name]["finished"] = True
+        _write_manifest(manifest_file, manifest)
+
+    def _prefilter_trees(
+        self,
+        msa_file: FilePath,
+        model: Model,
+        prefix: str,
+        manifest: Dict,
+        manifest_file: FilePath,
+        max_delta_llh: Optional[float],
+        tukeys_fence_k: Optional[float],
+        **kwargs,
+    ) -> Tuple[List[int], List[float]]:
+        eval_prefix = prefix + ".eval"
+        eval_cmd = self.iqtree.get_trees_eval_cmd(
+            msa_file=msa_file,
+            model=model,
+            treesfile=prefix + ".filtered.trees",
+            prefix=eval_prefix,
+            **kwargs,
+        )
+        self._run_stage(
+            "tree_evaluation",
+            eval_cmd,
+            manifest,
+            manifest_file,
+            eval_prefix + ".iqtree",
+            _get_bookkeeping_files(prefix),
+        )
+        llhs = [entry["logL"] for entry in iter_iqtree_results(eval_prefix + ".iqtree")]
+
+        lower = -math.inf
+        if max_delta_llh is not None:
+            lower = max(lower, max(llhs) - max_delta_llh)
+        if tukeys_fence_k is not None:
+            lower = max(lower, tukeys_fence(llhs, tukeys_fence_k)[0])
+
+        selected = [i for i, llh in enumerate(llhs) if llh >= lower]
+        return selected, llhs
 
     def perform_topology_tests(
         self,
@@ -93,27 +325,81 @@ class IQTreeTopologyTest:
         prefix: str,
         best_tree_file: FilePath = None,
         n_bootstrap_replicates: int = 10_000,
+        resume: bool = True,
+        max_delta_llh: float = None,
+        tukeys_fence_k: float = None,
         **kwargs,
-    ) -> Tuple[TreeIndexed[IqTreeMetrics], List]:
-        filtered_trees, clusters = filter_tree_topologies(
-            unfiltered_trees_file=unfiltered_trees_file, raxmlng=self.raxmlng
-        )
+    ) -> Tuple[StatsTestResults, List]:
+        """
+        Runs the topology tests for all unique topologies in unfiltered_trees_file.
+
+        If max_delta_llh or tukeys_fence_k is set, all unique topologies are first evaluated in a single
+        IQ-Tree run and only the trees within the likelihood window are passed on to the topology tests:
+        trees whose log-likelihood is more than max_delta_llh below the best one or below the lower
+        Tukey's fence (with factor tukeys_fence_k) of all log-likelihoods are reported as implausible
+        without being tested. The logL of the tested trees is the one of the topology test run and the logL of
+        the screened out trees the one of the evaluation run, the deltaL of all trees refers to the best logL
+        of all trees.
+
+        Args:
+            resume: Reuse the results of finished stages of a previous call with the same prefix and
+                resume an interrupted IQ-Tree run. If False, all stages are recomputed.
+            max_delta_llh: Log-likelihood window of the prefilter stage.
+            tukeys_fence_k: Factor of the interquartile range of the Tukey's fence of the prefilter stage.
+            **kwargs: Additional IQ-Tree options.
 
-        with TemporaryDirectory() as tmpdir:
-            filtered_trees_file = tmpdir + "filtered.trees"
-            write_trees_to_file(file_path=filtered_trees_file, trees=filtered_trees)
-
-            topology_test_cmd = self.iqtree.get_tree_topology_test_cmd(
-                msa_file=msa_file,
-                model=model,
-                treesfile=filtered_trees_file,
-                prefix=prefix,
-                best_tree_file=best_tree_file,
-                n_bootstrap_replicates=n_bootstrap_replicates,
-                **kwargs,
+        Returns:
+            A tuple (results, clusters): the IQ-Tree results of each topology and the trees of each topology.
+        """
+        manifest_file = prefix + ".manifest.json"
+        manifest = _read_manifest(manifest_file) if resume else {}
+
+        filtered_trees, clusters = self._filter_tree_topologies(unfiltered_trees_file, prefix, manifest, resume)
+        _write_manifest(manifest_file, manifest)
+
+        prefilter = max_delta_llh is not None or tukeys_fence_k is not None
+        tested_trees_file = prefix + ".filtered.trees"
+
+        if prefilter:
+            selected, llhs = self._prefilter_trees(
+                msa_file, model, prefix, manifest, manifest_file, max_delta_llh, tukeys_fence_k, **kwargs
             )
+            tested_trees_file = prefix + ".plausible.trees"
+            write_trees_to_file(file_path=tested_trees_file, trees=[filtered_trees[i] for i in selected])
+
+        topology_test_cmd = self.iqtree.get_tree_topology_test_cmd(
+            msa_file=msa_file,
+            model=model,
+            treesfile=tested_trees_file,
+            prefix=prefix,
+            best_tree_file=best_tree_file,
+            n_bootstrap_replicates=n_bootstrap_replicates,
+            **kwargs,
+        )
+        iqtree_log_file = prefix + ".iqtree"
+        self._run_stage(
+            "topology_tests",
+            topology_test_cmd,
+            manifest,
+            manifest_file,
+            iqtree_log_file,
+            _get_bookkeeping_files(prefix),
+        )
+
+        results = get_iqtree_results(iqtree_log_file)
+        if not prefilter:
+            return results, clusters
+
+        test_names = list(results[0]["tests"].keys())
+        all_results = [_get_screened_entry(llh, test_names) for llh in llhs]
+        for i, result in zip(selected, results):
+            all_results[i] = result
 
-            run_cmd(topology_test_cmd)
+        # the tested trees are evaluated again in the topology test run, so their deltaL refers to the best tree
+        # of that run: recompute deltaL of all trees against the best log-likelihood of all trees
+        all_llhs = [result.get("logL", llh) for result, llh in zip(all_results, llhs)]
+        best_llh = max(all_llhs)
+        for result, llh in zip(all_results, all_llhs):
+            result["deltaL"] = best_llh - llh
 
-            iqtree_log_file = prefix + ".iqtree"
-            return get_iqtree_results(iqtree_log_file), clusters
+        return StatsTestResults.from_dicts(all_results), clusters
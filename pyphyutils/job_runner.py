@@ -0,0 +1,216 @@
+from .custom_types import *
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import os
+import regex
+import signal
+import subprocess
+import time
+
+
+# command line options that set the number of threads of raxml-ng and IQ-Tree
+THREADS_OPTIONS = ["--threads", "-T", "-nt"]
+_THREADS_VALUE_RE = regex.compile(r"(?:auto\{)?(\d+)\}?", regex.IGNORECASE)
+
+
+class Job(NamedTuple):
+    """
+    A command to run with the resources it needs.
+
+    cmd: The command to run.
+    threads: Number of CPU slots the job occupies, defaults to the number of threads set in the command.
+    timeout: Time limit in seconds, the process group of the job is killed if it runs longer.
+    stdout_file: File to which stdout of the job is written, stdout is discarded if None.
+    stderr_file: File to which stderr of the job is written, stderr is passed through to stderr if None.
+    """
+
+    cmd: Command
+    threads: Optional[int] = None
+    timeout: Optional[float] = None
+    stdout_file: Optional[FilePath] = None
+    stderr_file: Optional[FilePath] = None
+
+
+class JobResult(NamedTuple):
+    """
+    returncode is None if the job timed out or could not be started, error holds the reason in the latter case,
+    e.g. a FileNotFoundError if the executable does not exist.
+    """
+
+    cmd: Command
+    returncode: Optional[int]
+    elapsed_time: float
+    timed_out: bool
+    stdout_file: Optional[FilePath]
+    stderr_file: Optional[FilePath]
+    error: Optional[OSError] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out and self.error is None
+
+
+def get_command_threads(cmd: Command) -> int:
+    """
+    Returns the number of threads set in the raxml-ng (--threads) or IQ-Tree (-T, -nt) command.
+    Defaults to 1 if the command does not set a fixed number of threads.
+    """
+    for option, value in zip(cmd, cmd[1:]):
+        if option in THREADS_OPTIONS:
+            m = _THREADS_VALUE_RE.fullmatch(str(value))
+            if m:
+                return max(1, int(m.group(1)))
+    return 1
+
+
+def _get_job(job) -> Job:
+    if isinstance(job, Job):
+        return job
+    return Job(cmd=list(job))
+
+
+def _kill_process_group(process: asyncio.subprocess.Process) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class _CPUSlots:
+    """
+    Counting semaphore for CPU slots that serves the waiting jobs in FIFO order,
+    so a job requesting many slots is not starved by a stream of jobs requesting few slots.
+    """
+
+    def __init__(self, num_slots: int):
+        self.num_slots = num_slots
+        self._free = num_slots
+        self._waiters = deque()
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self._waiters[0][0] <= self._free:
+            n, waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._free -= n
+                waiter.set_result(None)
+
+    async def acquire(self, n: int) -> None:
+        if not self._waiters and self._free >= n:
+            self._free -= n
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((n, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slots were granted just before the cancellation
+                self._free += n
+            elif (n, waiter) in self._waiters:
+                self._waiters.remove((n, waiter))
+            self._wake_waiters()
+            raise
+
+    async def release(self, n: int) -> None:
+        self._free += n
+        self._wake_waiters()
+
+
+async def _run_job(job: Job, slots: _CPUSlots) -> JobResult:
+    # jobs requesting more threads than available run alone instead of waiting forever
+    threads = min(job.threads or get_command_threads(job.cmd), slots.num_slots)
+    await slots.acquire(threads)
+    start = time.perf_counter()
+    try:
+        with ExitStack() as files:
+            try:
+                stdout = files.enter_context(open(job.stdout_file, "wb")) if job.stdout_file else subprocess.DEVNULL
+                stderr = files.enter_context(open(job.stderr_file, "wb")) if job.stderr_file else None
+                process = await asyncio.create_subprocess_exec(
+                    *job.cmd,
+                    stdout=stdout,
+                    stderr=stderr,
+                    start_new_session=True,
+                )
+            except OSError as e:
+                # e.g. the executable does not exist or the output files cannot be opened
+                return JobResult(
+                    cmd=job.cmd,
+                    returncode=None,
+                    elapsed_time=time.perf_counter() - start,
+                    timed_out=False,
+                    stdout_file=job.stdout_file,
+                    stderr_file=job.stderr_file,
+                    error=e,
+                )
+
+            timed_out = False
+            try:
+                await asyncio.wait_for(process.wait(), timeout=job.timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                _kill_process_group(process)
+                await process.wait()
+            except asyncio.CancelledError:
+                _kill_process_group(process)
+                await process.wait()
+                raise
+
+            return JobResult(
+                cmd=job.cmd,
+                returncode=None if timed_out else process.returncode,
+                elapsed_time=time.perf_counter() - start,
+                timed_out=timed_out,
+                stdout_file=job.stdout_file,
+                stderr_file=job.stderr_file,
+            )
+    finally:
+        await slots.release(threads)
+
+
+async def run_jobs_async(jobs: List, max_threads: int = None) -> List[JobResult]:
+    """
+    Runs all jobs concurrently such that the sum of the threads of all running jobs does not exceed max_threads.
+
+    Args:
+        jobs: List of Job objects or commands.
+        max_threads: Number of available CPU slots, defaults to the number of CPU cores.
+
+    Returns:
+        One JobResult per job in the order of the jobs. Failing jobs do not raise, check JobResult.ok.
+    """
+    slots = _CPUSlots(max_threads or os.cpu_count() or 1)
+    return list(await asyncio.gather(*[_run_job(_get_job(job), slots) for job in jobs]))
+
+
+def run_jobs(jobs: List, max_threads: int = None) -> List[JobResult]:
+    """
+    Synchronous version of run_jobs_async, blocks until all jobs are finished.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(run_jobs_async(jobs, max_threads))
+
+    # called from within a running event loop (e.g. a Jupyter notebook): run the jobs in a separate thread
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, run_jobs_async(jobs, max_threads)).result()
+
+
+def check_job_result(result: JobResult) -> None:
+    """
+    Raises:
+        OSError if the job could not be started.
+        subprocess.TimeoutExpired if the job timed out.
+        subprocess.CalledProcessError if the job exited with a non-zero exit code.
+    """
+    if result.error is not None:
+        raise result.error
+    if result.timed_out:
+        raise subprocess.TimeoutExpired(result.cmd, result.elapsed_time)
+    if result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, result.cmd)
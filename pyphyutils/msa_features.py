@@ -0,0 +1,318 @@
+from .custom_types import *
+from .msa_metrics import (
+    bollback_multinomial,
+    get_alignment_statistics,
+    get_data_type_from_model,
+    get_msa_avg_entropy,
+    get_number_of_sites,
+    get_number_of_taxa,
+    get_raxmlng_alignment_statistics,
+    read_encoded_alignment,
+    treelikeness_score,
+)
+
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import csv
+import glob
+import os
+import random
+import sys
+
+
+FEATURE_COLUMNS = [
+    "msa_file",
+    "data_type",
+    "num_taxa",
+    "num_sites",
+    "num_patterns",
+    "proportion_invariant_sites",
+    "proportion_gaps",
+    "avg_entropy",
+    "bollback",
+    "treelikeness",
+    "error",
+]
+
+# pyarrow type names of the FEATURE_COLUMNS for parquet output
+_COLUMN_TYPES = {
+    "msa_file": "string",
+    "data_type": "string",
+    "num_taxa": "int64",
+    "num_sites": "int64",
+    "num_patterns": "int64",
+    "proportion_invariant_sites": "float64",
+    "proportion_gaps": "float64",
+    "avg_entropy": "float64",
+    "bollback": "float64",
+    "treelikeness": "float64",
+    "error": "string",
+}
+
+
+def get_msa_features(
+    msa_file: FilePath,
+    data_type: str = "DNA",
+    model: Model = None,
+    use_raxmlng: bool = False,
+    raxmlng_executable: Executable = "raxml-ng",
+    seed: int = None,
+) -> Dict:
+    """
+    Computes all MSA features for the given msa_file. The alignment is read only once.
+
+    Args:
+        msa_file: Path to the .fasta or .phy MSA file.
+        data_type: "DNA" or "AA".
+        model: Model used for the pattern, invariant site and gap statistics.
+            Defaults to GTR+G for DNA and LG+G for AA data. Its data type has to match data_type.
+        use_raxmlng: Compute the pattern, invariant site and gap statistics using raxml-ng --parse
+            instead of natively using get_alignment_statistics.
+        raxmlng_executable: Path to the raxml-ng executable, only used if use_raxmlng is set.
+        seed: Random seed for the taxon subsampling of the treelikeness score.
+
+    Returns:
+        A dict containing a value for each of the FEATURE_COLUMNS.
+
+    Raises:
+        ValueError if the data type of the model does not match data_type.
+    """
+    if model is None:
+        model = "GTR+G" if data_type == "DNA" else "LG+G"
+    elif get_data_type_from_model(model) != data_type:
+        raise ValueError(
+            f"The model {model} is a model for {get_data_type_from_model(model)} data, but the data type is {data_type}."
+        )
+
+    msa = read_encoded_alignment(msa_file, data_type)
+
+    if use_raxmlng:
+        stats = get_raxmlng_alignment_statistics(msa_file, raxmlng_executable, model)
+    else:
+        stats = get_alignment_statistics(msa, model)
+
+    if seed is not None:
+        random.seed(seed)
+
+    return {
+        "msa_file": msa_file,
+        "data_type": data_type,
+        "num_taxa": get_number_of_taxa(msa),
+        "num_sites": get_number_of_sites(msa),
+        "num_patterns": stats["patterns"],
+        "proportion_invariant_sites": stats["invariant_sites"],
+        "proportion_gaps": stats["gaps"],
+        "avg_entropy": float(get_msa_avg_entropy(msa)),
+        "bollback": bollback_multinomial(msa),
+        "treelikeness": float(treelikeness_score(msa, data_type)),
+        "error": None,
+    }
+
+
+def _get_error_row(msa_file: FilePath, kwargs: Dict, error: str) -> Dict:
+    row = dict.fromkeys(FEATURE_COLUMNS)
+    row["msa_file"] = msa_file
+    row["data_type"] = kwargs.get("data_type", "DNA")
+    row["error"] = error
+    return row
+
+
+def _get_msa_features_row(msa_file: FilePath, kwargs: Dict) -> Dict:
+    try:
+        return get_msa_features(msa_file, **kwargs)
+    except Exception as e:
+        return _get_error_row(msa_file, kwargs, f"{type(e).__name__}: {e}")
+
+
+def _get_isolated_msa_features_row(msa_file: FilePath, kwargs: Dict) -> Dict:
+    # runs the MSA in its own worker process, so a dying worker only affects this MSA
+    try:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            return executor.submit(_get_msa_features_row, msa_file, kwargs).result()
+    except BrokenProcessPool:
+        return _get_error_row(msa_file, kwargs, "BrokenProcessPool: the worker process terminated abruptly")
+    except Exception as e:
+        return _get_error_row(msa_file, kwargs, f"{type(e).__name__}: {e}")
+
+
+def _process_msa_files(msa_files: List[FilePath], processes: int, kwargs: Dict, write_row) -> None:
+    pending_files = deque(msa_files)
+    while pending_files:
+        broken_files = []
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            running = {}
+            while running or (pending_files and not broken_files):
+                while pending_files and not broken_files and len(running) < 2 * processes:
+                    msa_file = pending_files.popleft()
+                    try:
+                        running[executor.submit(_get_msa_features_row, msa_file, kwargs)] = msa_file
+                    except BrokenProcessPool:
+                        # a worker died since the last wait, stop submitting to this pool
+                        broken_files.append(msa_file)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    msa_file = running.pop(future)
+                    try:
+                        write_row(future.result())
+                    except BrokenProcessPool:
+                        broken_files.append(msa_file)
+                    except Exception as e:
+                        write_row(_get_error_row(msa_file, kwargs, f"{type(e).__name__}: {e}"))
+
+        # a worker died (e.g. killed because it ran out of memory) and took down the pool with all MSAs in flight:
+        # rerun these MSAs one by one so only the MSA that kills its worker fails, then continue with a new pool
+        for msa_file in broken_files:
+            write_row(_get_isolated_msa_features_row(msa_file, kwargs))
+
+
+class _CSVFeatureWriter:
+    def __init__(self, output_file: FilePath):
+        self._file = open(output_file, "w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=FEATURE_COLUMNS)
+        self._writer.writeheader()
+
+    def write_row(self, row: Dict) -> None:
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _ParquetFeatureWriter:
+    def __init__(self, output_file: FilePath, row_group_size: int = 1000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Writing parquet files requires pyarrow. Install it or use a .csv output file.")
+
+        self._pa = pyarrow
+        self._schema = pyarrow.schema([(c, getattr(pyarrow, _COLUMN_TYPES[c])()) for c in FEATURE_COLUMNS])
+        self._writer = pyarrow.parquet.ParquetWriter(output_file, self._schema)
+        self._row_group_size = row_group_size
+        self._rows = []
+
+    def _flush(self) -> None:
+        if self._rows:
+            table = self._pa.Table.from_pylist(self._rows, schema=self._schema)
+            self._writer.write_table(table)
+            self._rows = []
+
+    def write_row(self, row: Dict) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self._row_group_size:
+            self._flush()
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+
+def _get_feature_writer(output_file: FilePath):
+    file_ending = os.path.splitext(output_file)[1]
+    if file_ending == ".csv":
+        return _CSVFeatureWriter(output_file)
+    elif file_ending == ".parquet":
+        return _ParquetFeatureWriter(output_file)
+    raise ValueError(f"This output file type is currently not supported: {file_ending}")
+
+
+def expand_msa_files(msa_files: List[str]) -> List[FilePath]:
+    """
+    Expands all glob patterns in msa_files. Entries without glob matches are kept as they are.
+    """
+    expanded = []
+    for pattern in msa_files:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        expanded.extend(matches if matches else [pattern])
+    return expanded
+
+
+def extract_msa_features(
+    msa_files: List[str],
+    output_file: FilePath,
+    processes: int = 1,
+    **kwargs,
+) -> Tuple[int, int]:
+    """
+    Computes the features of all msa_files and writes one row per MSA to the output_file (.csv or .parquet).
+
+    The MSAs are processed in a pool of processes and each row is written as soon as the MSA is finished,
+    so the rows are not in input order. At most 2 * processes MSAs are in flight at any time.
+    Failing MSAs do not abort the batch, their row contains the error message in the error column.
+    If a worker process dies, the pool is rebuilt and the MSAs that were in flight are rerun one by one.
+
+    Args:
+        msa_files: List of MSA files or glob patterns.
+        output_file: Path of the output .csv or .parquet file.
+        processes: Number of worker processes.
+        **kwargs: Passed on to get_msa_features.
+
+    Returns:
+        Tuple of the number of successfully processed and the number of failed MSAs.
+    """
+    msa_files = expand_msa_files(msa_files)
+    writer = _get_feature_writer(output_file)
+    num_succeeded = num_failed = 0
+
+    def _write(row):
+        nonlocal num_succeeded, num_failed
+        writer.write_row(row)
+        if row["error"] is None:
+            num_succeeded += 1
+        else:
+            num_failed += 1
+            print(f"Error processing {row['msa_file']}: {row['error']}", file=sys.stderr)
+
+    try:
+        if processes <= 1:
+            for msa_file in msa_files:
+                _write(_get_msa_features_row(msa_file, kwargs))
+        else:
+            _process_msa_files(msa_files, processes, kwargs, _write)
+    finally:
+        writer.close()
+
+    return num_succeeded, num_failed
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Compute MSA features (entropy, Bollback multinomial, treelikeness, patterns, "
+        "invariant sites, gaps) for many alignments."
+    )
+    parser.add_argument("msa_files", nargs="+", help="MSA files (.fasta or .phy) or glob patterns.")
+    parser.add_argument("-o", "--output", required=True, help="Output file (.csv or .parquet).")
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument("--data-type", choices=["DNA", "AA"], default="DNA")
+    parser.add_argument("--model", default=None, help="Model for the pattern, invariant site and gap statistics.")
+    parser.add_argument(
+        "--raxmlng-stats",
+        action="store_true",
+        help="Compute the pattern, invariant site and gap statistics using raxml-ng --parse instead of natively.",
+    )
+    parser.add_argument(
+        "--raxmlng", default="raxml-ng", help="Path to the raxml-ng executable, only used with --raxmlng-stats."
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for the treelikeness subsampling.")
+    args = parser.parse_args(argv)
+
+    num_succeeded, num_failed = extract_msa_features(
+        args.msa_files,
+        args.output,
+        processes=args.processes,
+        data_type=args.data_type,
+        model=args.model,
+        use_raxmlng=args.raxmlng_stats,
+        raxmlng_executable=args.raxmlng,
+        seed=args.seed,
+    )
+    print(f"Processed {num_succeeded + num_failed} MSAs: {num_succeeded} succeeded, {num_failed} failed.")
+    return 1 if num_failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,73 +1,38 @@
+from .distances import DNA_STATES, get_distance_matrix
+from .encoded_msa import (
+    CODE_LOOKUP,
+    GAP_CHARS,
+    GAP_CODE,
+    NUM_CODES,
+    NUM_STATES,
+    STATE_CHARS,
+    EncodedMSA,
+)
+from .msa_parser import parse_msa_file
 from .raxmlng import RAxMLNG
+from .raxmlng_parser import get_raxmlng_alignment_parse_results
+from .utils import DEFAULT_CACHE_DIR, chi2_survival, get_executable_version, get_file_hash
 
-from Bio import AlignIO
-from Bio.Align import MultipleSeqAlignment
-from Bio.Phylo.TreeConstruction import DistanceCalculator
-from collections import Counter
-from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
 import math
 import numpy as np
-from pathlib import Path
+import os
 import random
 import subprocess
-from tempfile import TemporaryDirectory, NamedTemporaryFile
+from tempfile import TemporaryDirectory
 
 
-STATE_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ!\"#$%&'()*+,/:;<=>@[\\]^_{|}~"
-GAP_CHARS = "-?."
-DNA_CHARS = "ACTG"
-
-
-def _convert_dna_msa_to_biopython_format(msa_file, tmpfile):
-    """
-    The unknonwn char in DNA MSA files for Biopython to work
-    has to be "N" instead of "X" -> replace all occurences
-    All "?" are gaps -> convert to "-"
-    Also all "U" need to be "T"
-    """
-    with open(msa_file) as f:
-        repl = f.read().replace("X", "N")
-        repl = repl.replace("?", "-")
-        repl = repl.replace("U", "T")
-        repl = repl.upper()
-
-    tmpfile.write(repl)
-
-
-def _convert_aa_msa_to_biopython_format(msa_file, tmpfile):
-    """
-    The unknonwn char in AA MSA files for Biopython to work
-    All "?" are gaps -> convert to "-"
-    """
-    with open(msa_file) as f:
-        repl = f.read().replace("?", "-")
-        repl = repl.upper()
-
-    tmpfile.write(repl)
+def read_alignment(msa_file, data_type="DNA"):
+    return read_encoded_alignment(msa_file, data_type).to_biopython()
 
 
-def _get_msa_file_format(msa_file):
+def read_encoded_alignment(msa_file, data_type="DNA"):
     """
-    For now: only support .fasta and .phy files
-    TODO: include more file types
+    Reads the .fasta or .phy msa_file directly into an EncodedMSA without intermediate copies of the file.
     """
-    file_ending = Path(msa_file).suffix
-    if file_ending == ".phy":
-        return "phylip-relaxed"
-    elif file_ending == ".fasta":
-        return "fasta"
-    raise ValueError(f"This file type is currently not supported: {file_ending}")
-
-
-def read_alignment(msa_file, data_type="DNA"):
-    with NamedTemporaryFile(mode="w") as tmpfile:
-        if data_type == "DNA":
-            _convert_dna_msa_to_biopython_format(msa_file, tmpfile)
-        else:
-            _convert_aa_msa_to_biopython_format(msa_file, tmpfile)
-
-        tmpfile.flush()
-        return AlignIO.read(tmpfile.name, format=_get_msa_file_format(msa_file))
+    return parse_msa_file(msa_file, data_type)
 
 
 def get_number_of_taxa(msa):
@@ -84,34 +49,52 @@ def remove_gaps_from_sequence(seq):
     return seq
 
 
-def get_column_entropy(column):
+def _get_entropies_from_code_counts(code_counts):
     # column_entropy = - sum(for every nucleotide x) {count(x)*log2(Prob(nuc x in col i))}
-    column = remove_gaps_from_sequence(column).upper()
-    entropy = 0
+    # code_counts has shape (columns, NUM_CODES), gaps do not count towards the column length
+    state_counts = code_counts[:, :NUM_STATES]
+    column_lengths = code_counts.sum(axis=1) - code_counts[:, GAP_CODE]
 
-    for char in STATE_CHARS:
-        count = str.count(column, char)
-        if count == 0:
-            entropy_x = 0
-        else:
-            prob = count / len(column)
-            entropy_x = prob * math.log2(prob)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        probs = state_counts / column_lengths[:, np.newaxis]
+        entropies_x = np.where(state_counts > 0, probs * np.log2(probs), 0.0)
 
-        entropy += entropy_x
+    entropies = -entropies_x.sum(axis=1)
 
-    entropy = -entropy
+    assert np.all(entropies >= 0), f"Entropy negative, check computation. Entropies are {entropies[entropies < 0]}"
 
-    assert entropy >= 0, f"Entropy negative, check computation. Entropy is {entropy}"
+    return entropies
 
-    return entropy
+
+def get_column_entropy(column):
+    codes = CODE_LOOKUP[np.frombuffer(column.encode("ascii", errors="replace"), dtype=np.uint8)]
+    code_counts = np.bincount(codes, minlength=NUM_CODES)[np.newaxis, :]
+    return float(_get_entropies_from_code_counts(code_counts)[0])
+
+
+def get_column_entropies(msa):
+    """
+    Returns a numpy array with the entropy of every column of the msa.
+    All columns are processed at once based on the per-site state counts of the encoded alignment.
+    """
+    msa = EncodedMSA.from_msa(msa)
+    return _get_entropies_from_code_counts(msa.get_site_code_counts())
 
 
 def get_msa_column_entropies(msa):
-    return [get_column_entropy(msa[:, i]) for i in range(msa.get_alignment_length())]
+    return get_column_entropies(msa).tolist()
 
 
 def get_msa_avg_entropy(msa):
-    return np.mean(get_msa_column_entropies(msa))
+    return np.mean(get_column_entropies(msa))
+
+
+def get_site_patterns(msa):
+    """
+    Returns the unique site patterns of the msa, their weights and the pattern index of each site.
+    See EncodedMSA.get_site_patterns for details.
+    """
+    return EncodedMSA.from_msa(msa).get_site_patterns()
 
 
 def bollback_multinomial(msa):
@@ -119,49 +102,109 @@ def bollback_multinomial(msa):
     Compute the bollback multinomial statistic on the msa file
     According to Bollback, JP: Bayesian model adequacy and choice in phylogenetics (2002)
     """
+    msa = EncodedMSA.from_msa(msa)
     msa_length = msa.get_alignment_length()
 
-    sites = []
-    for i in range(msa_length):
-        sites.append(msa[:, i])
-
-    site_counts = Counter(sites)
-    mult = 0
-    for i in site_counts:
-        N_i = site_counts[i]
-        mult += N_i * math.log(N_i)
+    _, site_counts, _ = msa.get_site_patterns()
 
+    mult = np.sum(site_counts * np.log(site_counts))
     mult = mult - msa_length * math.log(msa_length)
-    return mult
+    return float(mult)
 
 
-def _get_distance_matrix(msa, num_samples, data_type):
+def _get_distance_matrix(msa, num_samples, data_type, threads=1):
     """
     For large MSAs (i.e. more than num_samples taxa), computing the distance matrix
     is computationally very expensive.
     So for large MSAs, we rather compute the distance matrix on a subsample of at most num_samples sequences
     """
+    msa = EncodedMSA.from_msa(msa, data_type)
+
     if get_number_of_taxa(msa) > num_samples:
         sample_population = range(get_number_of_taxa(msa))
         selection = sorted(random.sample(sample_population, num_samples))
-        msa = MultipleSeqAlignment([msa[el] for el in selection])
+        msa = EncodedMSA(msa.matrix[selection], [msa.taxa[el] for el in selection], data_type)
 
     model = "blastn" if data_type == "DNA" else "blosum62"
-    calculator = DistanceCalculator(model=model)
-    dm = calculator.get_distance(msa)
-    return dm
+    return get_distance_matrix(msa, model=model, data_type=data_type, threads=threads)
+
+
+# distance matrix of the quartet worker processes, set once per process by _init_quartet_worker
+_QUARTET_DISTANCES = None
+
+
+def _init_quartet_worker(distances):
+    global _QUARTET_DISTANCES
+    _QUARTET_DISTANCES = distances
+
+
+def _get_quartet_delta_sum(X, Y, U, V, distances=None):
+    """
+    Returns the sum of the δ values of all quartets in product(X, Y, U, V).
+    The three quartet sums are broadcast to arrays of shape (|X|, |Y|, |U|, |V|).
+    """
+    if distances is None:
+        distances = _QUARTET_DISTANCES
+
+    dxv = distances[np.ix_(X, V)][:, np.newaxis, np.newaxis, :]
+    dyu = distances[np.ix_(Y, U)][np.newaxis, :, :, np.newaxis]
+    dxu = distances[np.ix_(X, U)][:, np.newaxis, :, np.newaxis]
+    dyv = distances[np.ix_(Y, V)][np.newaxis, :, np.newaxis, :]
+    dxy = distances[np.ix_(X, Y)][:, :, np.newaxis, np.newaxis]
+    duv = distances[np.ix_(U, V)][np.newaxis, np.newaxis, :, :]
+
+    dxv_yu = dxv + dyu
+    dxu_yv = dxu + dyv
+    dxy_uv = dxy + duv
+
+    smallest = np.minimum(np.minimum(dxv_yu, dxu_yv), dxy_uv)
+    largest = np.maximum(np.maximum(dxv_yu, dxu_yv), dxy_uv)
+    # median of three values without arithmetic to get exactly the same value as sorting
+    intermediate = np.maximum(np.minimum(dxv_yu, dxu_yv), np.minimum(np.maximum(dxv_yu, dxu_yv), dxy_uv))
+
+    numerator = largest - intermediate
+    denominator = largest - smallest
 
+    with np.errstate(divide="ignore", invalid="ignore"):
+        deltas = np.where(denominator == 0, 0.0, numerator / denominator)
 
-def treelikeness_score(msa, data_type):
+    assert np.all(deltas >= 0)
+    assert np.all(deltas <= 1)
+
+    return float(deltas.sum())
+
+
+def _get_quartet_blocks(X, Y, U, V, max_block_size):
+    """
+    Splits product(X, Y, U, V) into blocks (X_block, Y, U, V) or (x, Y_block, U, V)
+    containing at most max_block_size quartets (or a single (x, y) pair if |U| * |V| exceeds it).
+    """
+    num_uv = max(1, len(U) * len(V))
+    if num_uv * len(Y) <= max_block_size:
+        block_size = max(1, max_block_size // (num_uv * max(1, len(Y))))
+        for start in range(0, len(X), block_size):
+            yield X[start:start + block_size], Y, U, V
+    else:
+        block_size = max(1, max_block_size // num_uv)
+        for x in X:
+            for start in range(0, len(Y), block_size):
+                yield [x], Y[start:start + block_size], U, V
+
+
+def treelikeness_score(msa, data_type, num_samples=100, threads=1, max_block_size=1 << 20):
     """
     Compute the treelikeness score according to
     δ Plots: A Tool for Analyzing Phylogenetic Distance Data, Holland, Huber, Dress and Moulton (2002)
     https://doi.org/10.1093/oxfordjournals.molbev.a004030
+
+    The δ values are computed for blocks of at most max_block_size quartets at once.
+    If threads > 1, the distance matrix is computed using threads threads and
+    the blocks are distributed across a pool of threads processes.
     """
-    num_samples = min(get_number_of_taxa(msa), 100)
-    dm = _get_distance_matrix(msa, num_samples, data_type)
+    num_samples = min(get_number_of_taxa(msa), num_samples)
+    distances = np.abs(_get_distance_matrix(msa, num_samples, data_type, threads))
 
-    options = list(range(len(dm)))
+    options = list(range(len(distances)))
 
     frac = num_samples // 4
     X = options[:frac]
@@ -169,129 +212,290 @@ def treelikeness_score(msa, data_type):
     U = options[2 * frac:3 * frac]
     V = options[3 * frac:]
 
-    res = product(X, Y, U, V)
-    deltas = []
-    for x, y, u, v in res:
-        dxv = np.abs(dm[x, v])
-        dyu = np.abs(dm[y, u])
-        dxu = np.abs(dm[x, u])
-        dyv = np.abs(dm[y, v])
-        dxy = np.abs(dm[x, y])
-        duv = np.abs(dm[u, v])
-
-        # assert dm[x, v] >= 0, (x, v, dm[x, v])
-        # assert dm[y, u] >= 0, (y, u, dm[y, u])
-        # assert dm[x, u] >= 0, (x, u, dm[x, u])
-        # assert dm[y, v] >= 0, (y, v, dm[y, v])
-        # assert dm[x, y] >= 0, (x, y, dm[x, y])
-        # assert dm[u, v] >= 0, (u, v, dm[u, v])
-
-        dxv_yu = dxv + dyu
-        dxu_yv = dxu + dyv
-        dxy_uv = dxy + duv
-
-        vals = sorted([dxv_yu, dxu_yv, dxy_uv])
-        smallest = vals[0]
-        intermediate = vals[1]
-        largest = vals[2]
-
-        numerator = largest - intermediate
-        denominator = largest - smallest
-
-        if denominator == 0:
-            delta = 0
-        else:
-            delta = numerator / denominator
-        assert delta >= 0
-        assert delta <= 1
-        deltas.append(delta)
-
-    return np.mean(deltas)
+    num_quartets = len(X) * len(Y) * len(U) * len(V)
+    if num_quartets == 0:
+        return np.mean([])
+
+    blocks = list(_get_quartet_blocks(X, Y, U, V, max_block_size))
+
+    if threads > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(
+            max_workers=threads, initializer=_init_quartet_worker, initargs=(distances,)
+        ) as executor:
+            delta_sums = list(executor.map(_get_quartet_delta_sum, *zip(*blocks)))
+    else:
+        delta_sums = [_get_quartet_delta_sum(*block, distances=distances) for block in blocks]
+
+    return np.float64(math.fsum(delta_sums) / num_quartets)
+
+
+# in-process cache of the raxml-ng alignment statistics, see get_raxmlng_alignment_statistics
+_ALIGNMENT_STATISTICS_CACHE = {}
 
 
 def _run_raxmlng_alignment_parse(msa_file, raxmlng_executable, model, tmpdir):
     raxmlng = RAxMLNG(raxmlng_executable)
-    cmd = raxmlng._base_cmd(
+    prefix = os.path.join(tmpdir, "parse")
+    cmd = raxmlng.get_alignment_parse_cmd(
         msa_file=msa_file,
         model=model,
-        prefix=tmpdir,
+        prefix=prefix,
         threads=1
     )
 
     subprocess.check_output(cmd)
+    return prefix + ".raxml.log"
 
 
-def get_number_of_patterns(msa_file, raxmlng_executable="raxml-ng", model="GTR+G"):
+def get_raxmlng_alignment_statistics(
+    msa_file, raxmlng_executable="raxml-ng", model="GTR+G", cache_dir=DEFAULT_CACHE_DIR
+):
     """
-    The easiest way to get the number of patterns for the msa_file is to run
-    raxml-ng with the --parse option and parse the results.
+    Runs raxml-ng --parse once for the msa_file and returns all alignment statistics of the log file:
+    the number of sites and patterns and the fractions of invariant sites and gaps.
+
+    The results are cached in memory and, unless cache_dir is None, as json files in cache_dir.
+    The cache key consists of the hash of the MSA content and the model, so a cache hit neither starts
+    raxml-ng nor requires it to be installed. The raxml-ng version is only determined on a cache miss
+    and is stored next to the statistics in the cache file.
     """
+    key_data = json.dumps([get_file_hash(msa_file), model])
+    key = hashlib.sha256(key_data.encode()).hexdigest()
+
+    if key in _ALIGNMENT_STATISTICS_CACHE:
+        return dict(_ALIGNMENT_STATISTICS_CACHE[key])
+
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir, "alignment_statistics", key + ".json")
+        if os.path.isfile(cache_file):
+            with open(cache_file) as f:
+                stats = json.load(f)["statistics"]
+            _ALIGNMENT_STATISTICS_CACHE[key] = stats
+            return dict(stats)
+
+    version = get_executable_version(raxmlng_executable)
     with TemporaryDirectory() as tmpdir:
-        _run_raxmlng_alignment_parse(msa_file, raxmlng_executable, model, tmpdir)
+        log_file = _run_raxmlng_alignment_parse(msa_file, raxmlng_executable, model, tmpdir)
+        stats = get_raxmlng_alignment_parse_results(log_file)
+
+    _ALIGNMENT_STATISTICS_CACHE[key] = stats
 
-        log_file = tmpdir + ".raxml.log"
+    if cache_file is not None:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        # write to a temporary file first so that concurrent readers never see a partial file
+        tmp_cache_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_cache_file, "w") as f:
+            json.dump({"version": version, "statistics": stats}, f)
+        os.replace(tmp_cache_file, cache_file)
 
-        for line in open(log_file).readlines():
-            line = line.strip()
-            if not line.startswith("Alignment sites"):
-                continue
-            # Alignment sites / patterns: 1940 / 933
-            _, numbers = line.split(":")
-            sites, patterns = numbers.split("/")
-            return int(patterns)
+    return dict(stats)
 
 
-def get_percentage_of_invariant_sites(msa_file, raxmlng_executable="raxml-ng", model="GTR+G"):
+# substitution models of raxml-ng for DNA data, all other models (except BIN) are protein models
+RAXMLNG_DNA_MODELS = [
+    "JC", "K80", "F81", "HKY", "TN93ef", "TN93", "K81", "K81uf", "TPM2", "TPM2uf", "TPM3", "TPM3uf",
+    "TIM1", "TIM1uf", "TIM2", "TIM2uf", "TIM3", "TIM3uf", "TVMef", "TVM", "SYM", "GTR",
+]
+RAXMLNG_AA_STATES = "ARNDCQEGHILKMFPSTWYV"
+
+
+def get_data_type_from_model(model):
     """
-    The easiest way to get the number of patterns for the msa_file is to run
-    raxml-ng with the --parse option and parse the results.
+    Returns the data type ("DNA", "AA" or "BIN") of the given raxml-ng model string, e.g. "GTR+G" -> "DNA".
     """
-    with TemporaryDirectory() as tmpdir:
-        _run_raxmlng_alignment_parse(msa_file, raxmlng_executable, model, tmpdir)
+    base_model = model.split("+")[0].split("{")[0].strip().upper()
+    if base_model in (m.upper() for m in RAXMLNG_DNA_MODELS):
+        return "DNA"
+    if base_model == "BIN":
+        return "BIN"
+    return "AA"
 
-        log_file = tmpdir + ".raxml.log"
 
-        for line in open(log_file).readlines():
-            line = line.strip()
-            if not line.startswith("Invariant sites"):
-                continue
-            # Invariant sites: 80.77 %
-            _, number = line.split(":")
-            percentage, _ = number.strip().split(" ")
-            return float(percentage) / 100.0
+def _build_raxmlng_charmap(data_type):
+    """
+    Returns the mapping of each byte to its set of states as bitmask, following the character maps of libpll.
+    Undetermined characters map to the set of all states, invalid characters to 0.
+    """
+    if data_type == "DNA":
+        states = "ACGT"
+        ambiguities = {
+            "U": "T", "R": "AG", "Y": "CT", "S": "CG", "W": "AT", "K": "GT", "M": "AC",
+            "B": "CGT", "D": "AGT", "H": "ACT", "V": "ACG",
+        }
+        undetermined = "NXO-?."
+    elif data_type == "AA":
+        states = RAXMLNG_AA_STATES
+        ambiguities = {"B": "DN", "Z": "EQ", "J": "IL"}
+        undetermined = "XUO*-?."
+    else:
+        raise ValueError(
+            f"Alignment statistics are only supported for DNA and AA data, got {data_type}. Use use_raxmlng=True instead."
+        )
+
+    charmap = np.zeros(256, dtype=np.uint32)
+    all_states = (1 << len(states)) - 1
+
+    def _set(char, mask):
+        charmap[ord(char.upper())] = mask
+        charmap[ord(char.lower())] = mask
+
+    for i, state in enumerate(states):
+        _set(state, 1 << i)
+    for char, char_states in ambiguities.items():
+        _set(char, sum(1 << states.index(s) for s in char_states))
+    for char in undetermined:
+        _set(char, all_states)
+
+    return charmap, all_states
+
+
+def get_alignment_statistics(msa, model="GTR+G"):
+    """
+    Computes the alignment statistics that raxml-ng reports when parsing the msa without running raxml-ng:
+    the number of sites and patterns and the fractions of invariant sites and gaps.
+
+    As in raxml-ng, characters are mapped to their sets of states according to the data type of the model
+    and columns consisting only of undetermined characters (e.g. "-", "?", "N" for DNA, "X" for AA) are removed
+    before computing the statistics (raxml-ng warns about them and excludes them from the analysis).
+    Two sites are the same pattern if their state sets are identical (pattern compression of libpll),
+    a character is counted as gap if it is undetermined, and a site is invariant if the intersection of the
+    state sets of all characters is exactly one state (the definition of libpll, so e.g. a site consisting only of
+    "R" and "-" is not invariant).
+    Note that raxml-ng rounds the fractions to two decimal places in percent, the returned values are not rounded.
+
+    Raises:
+        ValueError if the msa contains characters that are invalid for the data type.
+    """
+    data_type = get_data_type_from_model(model)
+    msa = EncodedMSA.from_msa(msa, data_type)
+    charmap, all_states = _build_raxmlng_charmap(data_type)
+
+    invalid_bytes = np.flatnonzero((charmap == 0) & (msa.get_byte_counts() > 0))
+    if invalid_bytes.size > 0:
+        raise ValueError(f"Invalid character(s) {[chr(b) for b in invalid_bytes]} for data type {data_type}.")
+
+    patterns, weights, _ = msa.get_site_patterns()
+    state_sets = charmap[patterns]
+
+    # remove the fully undetermined columns
+    determined = np.any(state_sets != all_states, axis=0)
+    patterns = patterns[:, determined]
+    state_sets = state_sets[:, determined]
+    weights = weights[determined]
+    num_sites = int(np.sum(weights))
+
+    # characters with the same set of states are equivalent, map each byte to the first byte with the same state set
+    _, canonical_bytes = np.unique(charmap, return_index=True)
+    canonical_lookup = canonical_bytes[np.unique(charmap, return_inverse=True)[1].ravel()].astype(np.uint8)
+    canonical_patterns = EncodedMSA(canonical_lookup[patterns], msa.taxa, data_type)
+    num_patterns = canonical_patterns.get_site_patterns()[1].size if num_sites else 0
+
+    gaps_per_pattern = np.count_nonzero(state_sets == all_states, axis=0)
+    common_states = np.bitwise_and.reduce(state_sets, axis=0)
+    # exactly one common state
+    invariant_patterns = (common_states != 0) & ((common_states & (common_states - 1)) == 0)
+
+    num_cells = num_sites * msa.num_taxa
+    return {
+        "sites": num_sites,
+        "patterns": int(num_patterns),
+        "invariant_sites": float(np.sum(weights[invariant_patterns]) / num_sites) if num_sites else 0.0,
+        "gaps": float(np.sum(weights * gaps_per_pattern) / num_cells) if num_cells else 0.0,
+    }
+
+
+def _get_alignment_statistics(msa_file, raxmlng_executable, model, use_raxmlng):
+    if use_raxmlng:
+        return get_raxmlng_alignment_statistics(msa_file, raxmlng_executable, model)
+    return get_alignment_statistics(read_encoded_alignment(msa_file, get_data_type_from_model(model)), model)
+
+
+def get_number_of_patterns(msa_file, raxmlng_executable="raxml-ng", model="GTR+G", use_raxmlng=False):
+    """
+    Returns the number of patterns of the msa_file as defined by raxml-ng.
+    By default, the number is computed natively, set use_raxmlng to run raxml-ng with the --parse option instead.
+    """
+    return _get_alignment_statistics(msa_file, raxmlng_executable, model, use_raxmlng)["patterns"]
 
 
-def get_percentage_of_gaps(msa_file, raxmlng_executable="raxml-ng", model="GTR+G"):
+def get_percentage_of_invariant_sites(msa_file, raxmlng_executable="raxml-ng", model="GTR+G", use_raxmlng=False):
     """
-    The easiest way to get the number of patterns for the msa_file is to run
-    raxml-ng with the --parse option and parse the results.
+    Returns the fraction of invariant sites of the msa_file as defined by raxml-ng.
+    By default, the number is computed natively, set use_raxmlng to run raxml-ng with the --parse option instead.
     """
-    with TemporaryDirectory() as tmpdir:
-        _run_raxmlng_alignment_parse(msa_file, raxmlng_executable, model, tmpdir)
+    return _get_alignment_statistics(msa_file, raxmlng_executable, model, use_raxmlng)["invariant_sites"]
 
-        log_file = tmpdir + ".raxml.log"
 
-        for line in open(log_file).readlines():
-            line = line.strip()
-            if not line.startswith("Gaps"):
-                continue
-            # Gaps: 20.05 %
-            _, number = line.split(":")
-            percentage, _ = number.strip().split(" ")
-            return float(percentage) / 100.0
+def get_percentage_of_gaps(msa_file, raxmlng_executable="raxml-ng", model="GTR+G", use_raxmlng=False):
+    """
+    Returns the fraction of gaps of the msa_file as defined by raxml-ng.
+    By default, the number is computed natively, set use_raxmlng to run raxml-ng with the --parse option instead.
+    """
+    return _get_alignment_statistics(msa_file, raxmlng_executable, model, use_raxmlng)["gaps"]
 
 
 def get_character_frequencies(msa):
-    counts = {}
-
-    for char in STATE_CHARS:
-        counts[char] = 0
+    byte_counts = EncodedMSA.from_msa(msa).get_byte_counts()
+    return {char: int(byte_counts[ord(char)]) for char in STATE_CHARS}
 
-    for sequence in msa:
-        sequence = sequence.seq
-
-        for char in STATE_CHARS:
-            counts[char] += sequence.count(char)
-
-    return counts
 
+def get_character_composition(msa, states=None):
+    """
+    Computes the global and per-taxon state composition of the msa and tests the compositional
+    heterogeneity across taxa with a chi-square test, all based on a single counting pass over the alignment.
+
+    For each taxon, the observed state counts are compared to the counts expected under the global
+    state frequencies (as in the composition test of IQ-TREE). The sum over all taxa is the chi-square
+    statistic of the taxa x states contingency table.
+
+    Args:
+        msa: The alignment, either an EncodedMSA or a Biopython MultipleSeqAlignment.
+        states: The states to consider, defaults to ACGT for DNA and the 20 amino acids for AA data.
+            Lowercase characters are counted as the respective uppercase state, all other characters are ignored.
+
+    Returns:
+        A dict containing
+            "states": the considered states,
+            "counts": int array with the global count of each state,
+            "taxon_counts": int array of shape (taxa, states) with the state counts of each taxon,
+            "taxon_chi2": float array with the chi-square statistic of each taxon,
+            "taxon_p_values": float array with the p-value of each taxon (states - 1 degrees of freedom),
+            "chi2", "df", "p_value": chi-square statistic, degrees of freedom and p-value across all taxa.
+    """
+    msa = EncodedMSA.from_msa(msa)
+    if states is None:
+        states = DNA_STATES if msa.data_type == "DNA" else RAXMLNG_AA_STATES
+
+    byte_counts = msa.get_taxon_byte_counts()
+    upper = [ord(s.upper()) for s in states]
+    lower = [ord(s.lower()) for s in states]
+    taxon_counts = byte_counts[:, upper] + np.where(np.array(upper) != np.array(lower), byte_counts[:, lower], 0)
+    counts = taxon_counts.sum(axis=0)
+
+    total = counts.sum()
+    taxon_totals = taxon_counts.sum(axis=1)
+    expected = np.outer(taxon_totals, counts) / total if total else np.zeros(taxon_counts.shape)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cells = np.where(expected > 0, (taxon_counts - expected) ** 2 / expected, 0.0)
+    taxon_chi2 = cells.sum(axis=1)
+
+    # states and taxa without any counts do not contribute degrees of freedom
+    num_observed_states = int(np.count_nonzero(counts))
+    num_observed_taxa = int(np.count_nonzero(taxon_totals))
+    taxon_df = num_observed_states - 1
+    df = (num_observed_taxa - 1) * taxon_df
+
+    chi2 = float(taxon_chi2.sum())
+
+    return {
+        "states": states,
+        "counts": counts,
+        "taxon_counts": taxon_counts,
+        "taxon_chi2": taxon_chi2,
+        "taxon_p_values": np.array([chi2_survival(x, taxon_df) for x in taxon_chi2]),
+        "chi2": chi2,
+        "df": df,
+        "p_value": chi2_survival(chi2, df),
+    }
@@ -0,0 +1,152 @@
+from .custom_types import *
+from .encoded_msa import EncodedMSA
+
+import mmap
+import numpy as np
+from pathlib import Path
+
+
+_WHITESPACE = b" \t\r\n\v\f"
+
+
+def _build_translation_table(data_type: str) -> bytes:
+    """
+    Returns the bytes.translate table that normalises the sequence characters:
+    All "?" are gaps -> convert to "-"
+    For DNA data the unknown char "X" is replaced by "N" and "U" is replaced by "T"
+    Finally all characters are uppercased.
+    Note that the replacements happen before uppercasing, so "x" and "u" are only uppercased.
+    """
+    table = bytearray(bytes.maketrans(b"abcdefghijklmnopqrstuvwxyz", b"ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    table[ord("?")] = ord("-")
+    if data_type == "DNA":
+        table[ord("X")] = ord("N")
+        table[ord("U")] = ord("T")
+    return bytes(table)
+
+
+def _normalise(raw: bytes, table: bytes) -> bytes:
+    return raw.translate(table, _WHITESPACE)
+
+
+def _get_header_name(header_line: bytes) -> str:
+    # header line looks like this: ">taxon_name some description"
+    parts = header_line[1:].split(None, 1)
+    return parts[0].decode() if parts else ""
+
+
+def _parse_fasta(mm: mmap.mmap, msa_file: FilePath, table: bytes, data_type: str) -> EncodedMSA:
+    # first pass: find the offsets of all header lines
+    header_offsets = []
+    pos = 0 if mm[:1] == b">" else mm.find(b"\n>")
+    if pos == -1 or mm[:pos].strip():
+        raise ValueError(f"The given input file {msa_file} is not a valid FASTA file.")
+
+    while pos != -1:
+        if mm[pos:pos + 1] == b"\n":
+            pos += 1
+        header_offsets.append(pos)
+        pos = mm.find(b"\n>", pos)
+
+    record_ends = header_offsets[1:] + [len(mm)]
+
+    def _read_record(i):
+        start = header_offsets[i]
+        header_end = mm.find(b"\n", start, record_ends[i])
+        if header_end == -1:
+            header_end = record_ends[i]
+        name = _get_header_name(mm[start:header_end])
+        sequence = _normalise(mm[header_end:record_ends[i]], table)
+        return name, sequence
+
+    # second pass: fill the alignment matrix record by record
+    name, sequence = _read_record(0)
+    matrix = np.empty((len(header_offsets), len(sequence)), dtype=np.uint8)
+    taxa = []
+
+    for i in range(len(header_offsets)):
+        if i > 0:
+            name, sequence = _read_record(i)
+        if len(sequence) != matrix.shape[1]:
+            raise ValueError(
+                f"Sequences must all be the same length. Sequence {name} in {msa_file} has length {len(sequence)}, expected {matrix.shape[1]}."
+            )
+        matrix[i] = np.frombuffer(sequence, dtype=np.uint8)
+        taxa.append(name)
+
+    return EncodedMSA(matrix, taxa, data_type)
+
+
+def _parse_phylip(mm: mmap.mmap, msa_file: FilePath, table: bytes, data_type: str) -> EncodedMSA:
+    """
+    Parses relaxed PHYLIP files in sequential one-line-per-taxon or interleaved format.
+    """
+    lines = (line for line in iter(mm.readline, b"") if line.strip())
+
+    try:
+        num_taxa, num_sites = (int(v) for v in next(lines).split()[:2])
+    except (StopIteration, ValueError):
+        raise ValueError(f"The given input file {msa_file} does not start with a valid PHYLIP header.")
+
+    matrix = np.empty((num_taxa, num_sites), dtype=np.uint8)
+    filled = np.zeros(num_taxa, dtype=np.int64)
+    taxa = []
+
+    for i, line in enumerate(lines):
+        taxon = i % num_taxa
+        if i < num_taxa:
+            # first block: line looks like this: "taxon_name ACGT..."
+            parts = line.split(None, 1)
+            taxa.append(parts[0].decode())
+            line = parts[1] if len(parts) > 1 else b""
+
+        sequence = _normalise(line, table)
+        start = filled[taxon]
+        if start + len(sequence) > num_sites:
+            raise ValueError(
+                f"Sequence {taxa[taxon]} in {msa_file} is longer than the {num_sites} sites stated in the header."
+            )
+        matrix[taxon, start:start + len(sequence)] = np.frombuffer(sequence, dtype=np.uint8)
+        filled[taxon] += len(sequence)
+
+    if len(taxa) != num_taxa or np.any(filled != num_sites):
+        raise ValueError(
+            f"The given input file {msa_file} does not contain {num_taxa} sequences of length {num_sites}."
+        )
+
+    return EncodedMSA(matrix, taxa, data_type)
+
+
+def parse_msa_file(msa_file: FilePath, data_type: str = "DNA") -> EncodedMSA:
+    """
+    Reads the given .fasta or .phy file directly into an EncodedMSA.
+    The file is memory-mapped and processed record by record (or line by line),
+    so apart from the alignment matrix only one record is held in memory at a time.
+
+    Args:
+        msa_file: Path to the MSA file.
+        data_type: "DNA" or "AA", determines the character normalisation.
+
+    Returns:
+        The encoded alignment.
+
+    Raises:
+        ValueError if the file type is not supported or the file is malformed.
+    """
+    file_ending = Path(msa_file).suffix
+    if file_ending == ".phy":
+        parse = _parse_phylip
+    elif file_ending == ".fasta":
+        parse = _parse_fasta
+    else:
+        raise ValueError(f"This file type is currently not supported: {file_ending}")
+
+    table = _build_translation_table(data_type)
+
+    with open(msa_file, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError(f"The given input file {msa_file} is empty.")
+        with mm:
+            return parse(mm, msa_file, table, data_type)
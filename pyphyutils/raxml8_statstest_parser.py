@@ -1,39 +1,39 @@
+from .statstest_results import StatsTestResults
 from .utils import *
 from .regex_constants import *
 
+import numpy as np
 import regex
 
 
-def get_raxml_shtest_results(raxml_file: FilePath) -> TreeIndexed[RaxMetrics]:
+def get_raxml_shtest_results(raxml_file: FilePath) -> StatsTestResults:
     sh_regex = rf"Tree:{blanks}{tree_id_re} Likelihood:{blanks}({llh_re}){blanks}D\(LH\):{blanks}({deltaL_re}){blanks}SD:{blanks}([-+]?{float_re}){blanks}Significantly{blanks}Worse:{blanks}([a-zA-Z]+){blanks}\(5%\),{blanks}([a-zA-Z]+){blanks}\(2%\),{blanks}([a-zA-Z]+)\.*"
     sh_regex = regex.compile(sh_regex)
 
-    results = []
+    values = []
     for line in read_file_contents(raxml_file):
         if line.startswith("Tree"):
             m = regex.match(sh_regex, line)
             if m:
-                llh, delta_llh, sd = (float(el) for el in m.groups()[:3])
-                sign_five, sign_two, sign_one = (
-                    True if el.lower() == "no" else False for el in m.groups()[3:]
-                )
+                values.append(m.groups())
 
-                results.append(
-                    {
-                        "logL": llh,
-                        "deltaL": delta_llh,
-                        "sd": sd,
-                        "significant": {
-                            "5%": sign_five,
-                            "2%": sign_two,
-                            "1%": sign_one,
-                        },
-                    }
-                )
-    return results
+    values = np.array(values, dtype=object).reshape(-1, 6)
+    # significant means that the tree is not significantly worse
+    not_worse = np.char.lower(values[:, 3:].astype(str)) == "no"
 
+    return StatsTestResults(
+        {
+            "logL": values[:, 0].astype(np.float64),
+            "deltaL": values[:, 1].astype(np.float64),
+            "sd": values[:, 2].astype(np.float64),
+            "significant/5%": not_worse[:, 0],
+            "significant/2%": not_worse[:, 1],
+            "significant/1%": not_worse[:, 2],
+        }
+    )
 
-def get_raxml_elwtest_results(raxml_file: FilePath) -> TreeIndexed[RaxMetrics]:
+
+def get_raxml_elwtest_results(raxml_file: FilePath) -> StatsTestResults:
     likelihoods = []
     content = read_file_contents(raxml_file)
     for line in content:
@@ -55,11 +55,10 @@ def get_raxml_elwtest_results(raxml_file: FilePath) -> TreeIndexed[RaxMetrics]:
         posterior_probs[int(tree_id)] = float(posterior_prob)
         cumulative_probs[int(tree_id)] = float(cumulative_prob)
 
-    results = []
-    for llh, post_prob, cum_prob in zip(likelihoods, posterior_probs, cumulative_probs):
-        results.append({
-            "logL": llh,
-            "c-ELW": post_prob,
-            "cumulative_c-elw": cum_prob
-        })
-    return results
+    return StatsTestResults(
+        {
+            "logL": np.array(likelihoods, dtype=np.float64),
+            "c-ELW": np.array(posterior_probs, dtype=np.float64),
+            "cumulative_c-elw": np.array(cumulative_probs, dtype=np.float64),
+        }
+    )
@@ -1,6 +1,9 @@
 from .regex_constants import *
 from .utils import *
 
+import math
+import numpy as np
+import os
 import regex
 
 
@@ -12,82 +15,416 @@ def get_raxmlng_run_param_value(line: str, param_identifier: str) -> float:
     return float(value)
 
 
+def _parse_elapsed_time(line: str) -> float:
+    # two cases now:
+    # either the run was cancelled an rescheduled
+    if "restarts" in line:
+        # line looks like this: "Elapsed time: 5562.869 seconds (this run) / 91413.668 seconds (total with restarts)"
+        _, right = line.split("/")
+        value = right.split(" ")[1]
+        return float(value)
+
+    # ...or the run ran in one sitting...
+    else:
+        # line looks like this: "Elapsed time: 63514.086 seconds"
+        value = line.split(" ")[2]
+        return float(value)
+
+
+class RaxmlNGLogRecord(NamedTuple):
+    seed: Optional[int]
+    starting_tree_type: Optional[str]
+    final_llh: Optional[float]
+    elapsed_time: Optional[float]
+    num_unique_topos: Optional[int]
+    abs_rf_distance: Optional[float]
+    rel_rf_distance: Optional[float]
+
+
+# fields printed in the header of the log: name -> (line matcher, value parser)
+_RAXMLNG_HEAD_FIELDS = {
+    "seed": (lambda l: "random seed:" in l, lambda l: int(get_value_from_line(l, "random seed:"))),
+    # start tree(s): random (1)
+    "starting_tree_type": (lambda l: l.startswith("start tree"), lambda l: l.split()[2].strip()),
+}
+
+# fields printed at the end of the log
+_RAXMLNG_TAIL_FIELDS = {
+    "final_llh": (lambda l: "Final LogLikelihood:" in l, lambda l: get_value_from_line(l, "Final LogLikelihood:")),
+    "elapsed_time": (lambda l: "Elapsed time:" in l, _parse_elapsed_time),
+    "num_unique_topos": (
+        lambda l: "Number of unique topologies in this tree set:" in l,
+        lambda l: int(get_value_from_line(l, "Number of unique topologies in this tree set:")),
+    ),
+    "abs_rf_distance": (
+        lambda l: "Average absolute RF distance in this tree set:" in l,
+        lambda l: get_value_from_line(l, "Average absolute RF distance in this tree set:"),
+    ),
+    "rel_rf_distance": (
+        lambda l: "Average relative RF distance in this tree set:" in l,
+        lambda l: get_value_from_line(l, "Average relative RF distance in this tree set:"),
+    ),
+}
+
+# lines of the log after the header start with a timestamp like this: "[00:00:00] Reading alignment"
+_RAXMLNG_TIMESTAMP_RE = regex.compile(r"\[\d+:\d{2}:\d{2}\]")
+
+
+class RaxmlNGLog:
+    """
+    Lazily parsed RAxML-NG log file.
+
+    On first access of any field, the file is scanned once: the header is read from the front until
+    the first timestamped line and the final summary is read backwards from the end of the file
+    until the last timestamped line, so for long logs only the header and the final lines are read.
+    """
+
+    def __init__(self, log_file: FilePath, block_size: int = 1 << 16):
+        self.log_file = log_file
+        self._block_size = block_size
+        self._fields = None
+
+    def _match_line(self, line: str, fields: Dict, missing: Dict) -> None:
+        line = line.strip()
+        for name, (matches, parse) in list(missing.items()):
+            if matches(line):
+                fields[name] = parse(line)
+                del missing[name]
+
+    def _read_lines_backwards(self, f, start: int, end: int):
+        remainder = b""
+        position = end
+        while position > start:
+            block_start = max(start, position - self._block_size)
+            f.seek(block_start)
+            block = f.read(position - block_start) + remainder
+            position = block_start
+            lines = block.split(b"\n")
+            # the first line of the block may be incomplete unless we reached the start
+            remainder = lines.pop(0) if position > start else b""
+            for line in reversed(lines):
+                yield line.decode(errors="replace")
+        if remainder:
+            yield remainder.decode(errors="replace")
+
+    def _scan(self) -> Dict:
+        fields = {}
+        missing = dict(_RAXMLNG_HEAD_FIELDS)
+        missing.update(_RAXMLNG_TAIL_FIELDS)
+
+        with open(self.log_file, "rb") as f:
+            for raw_line in iter(f.readline, b""):
+                line = raw_line.decode(errors="replace")
+                if _RAXMLNG_TIMESTAMP_RE.match(line.strip()):
+                    break
+                self._match_line(line, fields, missing)
+                if all(name in fields for name in _RAXMLNG_HEAD_FIELDS):
+                    break
+            header_end = f.tell()
+
+            # the final summary of the log follows the last timestamped line
+            end = f.seek(0, 2)
+            for line in self._read_lines_backwards(f, header_end, end):
+                if not missing or _RAXMLNG_TIMESTAMP_RE.match(line.strip()):
+                    break
+                self._match_line(line, fields, missing)
+
+        return fields
+
+    @property
+    def fields(self) -> Dict:
+        if self._fields is None:
+            self._fields = self._scan()
+        return self._fields
+
+    def _get_field(self, name: str, description: str):
+        if name not in self.fields:
+            raise ValueError(f"The given input file {self.log_file} does not contain the {description}.")
+        return self.fields[name]
+
+    def to_record(self) -> RaxmlNGLogRecord:
+        """
+        Returns all fields as typed record, fields that are not contained in the log are None.
+        """
+        return RaxmlNGLogRecord(**{name: self.fields.get(name) for name in RaxmlNGLogRecord._fields})
+
+    @property
+    def seed(self) -> int:
+        return self._get_field("seed", "random seed")
+
+    @property
+    def starting_tree_type(self) -> Optional[str]:
+        return self.fields.get("starting_tree_type")
+
+    @property
+    def final_llh(self) -> float:
+        return self._get_field("final_llh", "final log-likelihood")
+
+    @property
+    def elapsed_time(self) -> float:
+        return self._get_field("elapsed_time", "elapsed time")
+
+    @property
+    def num_unique_topos(self) -> int:
+        return self._get_field("num_unique_topos", "number of unique topologies")
+
+    @property
+    def abs_rf_distance(self) -> float:
+        return self._get_field("abs_rf_distance", "average absolute RF distance")
+
+    @property
+    def rel_rf_distance(self) -> float:
+        return self._get_field("rel_rf_distance", "average relative RF distance")
+
+
 def get_raxmlng_seed(raxmlng_file: FilePath) -> int:
-    STR = "random seed:"
-    return int(get_single_value_from_file(raxmlng_file, STR))
+    return RaxmlNGLog(raxmlng_file).seed
 
 
 def get_raxmlng_final_llh(raxmlng_file: FilePath) -> float:
-    STR = "Final LogLikelihood:"
-    return get_single_value_from_file(raxmlng_file, STR)
+    return RaxmlNGLog(raxmlng_file).final_llh
 
 
 def get_raxmlng_elapsed_time(log_file: FilePath) -> float:
-    for line in read_file_contents(log_file):
-        if not "Elapsed time:" in line:
-            continue
-        # two cases now:
-        # either the run was cancelled an rescheduled
-        if "restarts" in line:
-            # line looks like this: "Elapsed time: 5562.869 seconds (this run) / 91413.668 seconds (total with restarts)"
-            _, right = line.split("/")
-            value = right.split(" ")[1]
-            return float(value)
-
-        # ...or the run ran in one sitting...
-        else:
-            # line looks like this: "Elapsed time: 63514.086 seconds"
-            value = line.split(" ")[2]
-            return float(value)
-
-    raise ValueError(
-        f"The given input file {log_file} does not contain the elapsed time."
-    )
+    return RaxmlNGLog(log_file).elapsed_time
 
 
 def get_raxmlng_starting_tree_type(log_file: FilePath) -> str:
+    return RaxmlNGLog(log_file).starting_tree_type
+
+
+def get_raxmlng_alignment_parse_results(log_file: FilePath) -> AlignmentStatistics:
+    """
+    Returns the alignment statistics reported by raxml-ng when parsing an alignment.
+
+    Args:
+        log_file: Path to the .raxml.log file of a raxml-ng --parse run.
+
+    Returns:
+        A dict containing the number of sites and patterns and the fractions of invariant sites and gaps.
+
+    Raises:
+        ValueError if the log file does not contain all statistics.
+    """
+    stats = {}
+
     for line in read_file_contents(log_file):
-        if not line.startswith("start tree"):
-            continue
-        # start tree(s): random (1)
-        return line.split()[2].strip()
+        if line.startswith("Alignment sites"):
+            # Alignment sites / patterns: 1940 / 933
+            _, numbers = line.split(":")
+            sites, patterns = numbers.split("/")
+            stats["sites"] = int(sites)
+            stats["patterns"] = int(patterns)
+        elif line.startswith("Invariant sites") or line.startswith("Gaps"):
+            # Invariant sites: 80.77 %
+            # Gaps: 20.05 %
+            name, number = line.split(":")
+            percentage, _ = number.strip().split(" ")
+            key = "gaps" if name == "Gaps" else "invariant_sites"
+            stats[key] = float(percentage) / 100.0
+
+    if len(stats) != 4:
+        raise ValueError(
+            f"The given input file {log_file} does not contain all alignment statistics."
+        )
+
+    return stats
 
 
 def get_raxmlng_abs_rf_distance(log_file: FilePath) -> float:
-    STR = "Average absolute RF distance in this tree set:"
-    return get_single_value_from_file(log_file, STR)
+    return RaxmlNGLog(log_file).abs_rf_distance
 
 
 def get_raxmlng_rel_rf_distance(log_file: FilePath) -> float:
-    STR = "Average relative RF distance in this tree set:"
-    return get_single_value_from_file(log_file, STR)
+    return RaxmlNGLog(log_file).rel_rf_distance
 
 
 def get_raxmlng_num_unique_topos(log_file: FilePath) -> int:
-    STR = "Number of unique topologies in this tree set:"
-    return int(get_single_value_from_file(log_file, STR))
+    return RaxmlNGLog(log_file).num_unique_topos
+
+
+_RF_DIST_LINE_RE = regex.compile(fr"({tree_id_re}){blanks}({tree_id_re}){blanks}(\d+){blanks}({float_re})\s*")
 
 
 def get_cleaned_rf_dist(raw_line: str) -> Tuple[int, int, float, float]:
-    line_regex = regex.compile(fr"({tree_id_re}){blanks}({tree_id_re}){blanks}(\d+){blanks}({float_re})\s*")
     tree_idx1, tree_idx2, plain_dist, normalized_dist = regex.search(
-        line_regex, raw_line
+        _RF_DIST_LINE_RE, raw_line
     ).groups()
     return int(tree_idx1), int(tree_idx2), float(plain_dist), float(normalized_dist)
 
 
+def _iter_rfdistance_chunks(rfdistances_file_path: FilePath, chunk_size: int = 1 << 24) -> Iterator[np.ndarray]:
+    """
+    Parses the .raxml.rfDistances file in chunks of about chunk_size bytes.
+    Each line looks like this: "0 1 6 0.5" (tree index 1, tree index 2, absolute and relative RF distance).
+
+    Yields:
+        float64 arrays of shape (lines, 4) containing the values of all complete lines of the chunk.
+    """
+    remainder = b""
+    with open(rfdistances_file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            chunk = remainder + chunk
+            last_newline = chunk.rfind(b"\n")
+            if last_newline == -1:
+                remainder = chunk
+                continue
+            remainder = chunk[last_newline + 1:]
+            values = np.fromstring(chunk[:last_newline + 1].decode(), dtype=np.float64, sep=" ")
+            yield values.reshape(-1, 4)
+    if remainder.strip():
+        yield np.fromstring(remainder.decode(), dtype=np.float64, sep=" ").reshape(-1, 4)
+
+
+def _get_last_line(file_path: FilePath, block_size: int = 4096) -> bytes:
+    with open(file_path, "rb") as f:
+        end = f.seek(0, 2)
+        position = end
+        data = b""
+        while position > 0:
+            position = max(0, position - block_size)
+            f.seek(position)
+            data = f.read(end - position)
+            lines = data.rstrip().split(b"\n")
+            if len(lines) > 1 or position == 0:
+                return lines[-1]
+    return data
+
+
+def condensed_index(i, j, num_trees: int):
+    """
+    Returns the index of the tree pair (i, j), i != j, in a condensed distance array
+    as used by scipy.spatial.distance (i.e. pairs (0, 1), (0, 2), ..., (0, n-1), (1, 2), ...).
+    Works for ints and integer numpy arrays.
+    """
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    return num_trees * i - i * (i + 1) // 2 + (j - i - 1)
+
+
+class RFDistances:
+    """
+    Pairwise absolute and relative RF distances of num_trees trees stored as condensed float64 arrays
+    in the layout of scipy.spatial.distance (use scipy.spatial.distance.squareform to get the full matrices).
+    """
+
+    def __init__(self, abs_distances: np.ndarray, rel_distances: np.ndarray, num_trees: int):
+        expected_size = num_trees * (num_trees - 1) // 2
+        if abs_distances.shape != (expected_size,) or rel_distances.shape != (expected_size,):
+            raise ValueError(
+                f"Condensed distance arrays for {num_trees} trees need to have length {expected_size}."
+            )
+        self.abs_distances = abs_distances
+        self.rel_distances = rel_distances
+        self.num_trees = num_trees
+
+    def _get_distance(self, distances: np.ndarray, tree_idx1: TreeIndex, tree_idx2: TreeIndex) -> float:
+        if tree_idx1 == tree_idx2:
+            return 0.0
+        return float(distances[condensed_index(tree_idx1, tree_idx2, self.num_trees)])
+
+    def get_abs_distance(self, tree_idx1: TreeIndex, tree_idx2: TreeIndex) -> float:
+        return self._get_distance(self.abs_distances, tree_idx1, tree_idx2)
+
+    def get_rel_distance(self, tree_idx1: TreeIndex, tree_idx2: TreeIndex) -> float:
+        return self._get_distance(self.rel_distances, tree_idx1, tree_idx2)
+
+    def get_average_abs_distance(self) -> float:
+        return float(np.mean(self.abs_distances)) if self.abs_distances.size else 0.0
+
+    def get_average_rel_distance(self) -> float:
+        return float(np.mean(self.rel_distances)) if self.rel_distances.size else 0.0
+
+    def get_duplicate_trees(self) -> np.ndarray:
+        """
+        Returns a bool array that is True for each tree with RF distance 0 to any tree with a smaller index.
+        """
+        duplicates = np.zeros(self.num_trees, dtype=bool)
+        for i in range(self.num_trees - 1):
+            start = condensed_index(i, i + 1, self.num_trees)
+            row = self.abs_distances[start:start + self.num_trees - i - 1]
+            duplicates[i + 1:] |= row == 0
+        return duplicates
+
+    def get_num_unique_topos(self) -> int:
+        return int(self.num_trees - np.count_nonzero(self.get_duplicate_trees()))
+
+    def to_dicts(self) -> Tuple[TreeTreeIndexed, TreeTreeIndexed]:
+        """
+        Returns the distances as dicts (tree_idx1, tree_idx2) -> distance as returned by get_pairwise_rfdistances.
+        """
+        pairs = [(i, j) for i in range(self.num_trees) for j in range(i + 1, self.num_trees)]
+        return (
+            dict(zip(pairs, self.abs_distances.tolist())),
+            dict(zip(pairs, self.rel_distances.tolist())),
+        )
+
+
+def load_pairwise_rfdistances(
+    rfdistances_file_path: FilePath, use_cache: bool = False, mmap: bool = True
+) -> RFDistances:
+    """
+    Loads the .raxml.rfDistances file into condensed numpy arrays.
+
+    Args:
+        rfdistances_file_path: Path to the .raxml.rfDistances file written by raxml-ng --rfdist.
+        use_cache: If set, the parsed distances are stored in the sidecar file rfdistances_file_path + ".npy".
+            Subsequent loads read the sidecar instead of parsing the text file as long as it is newer than the text file.
+        mmap: Memory-map the sidecar file instead of reading it into memory.
+
+    Returns:
+        The RFDistances of all tree pairs.
+
+    Raises:
+        ValueError if the file does not contain the distances of all tree pairs.
+    """
+    cache_file = rfdistances_file_path + ".npy"
+    if use_cache and os.path.isfile(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(rfdistances_file_path):
+        distances = np.load(cache_file, mmap_mode="r" if mmap else None)
+        num_trees = int(round((1 + math.sqrt(1 + 8 * distances.shape[1])) / 2))
+        return RFDistances(distances[0], distances[1], num_trees)
+
+    # raxml-ng writes all pairs in condensed order, so the last line contains the pair (n-2, n-1)
+    last_line = _get_last_line(rfdistances_file_path).split()
+    num_trees = int(last_line[1]) + 1 if last_line else 0
+    num_pairs = num_trees * (num_trees - 1) // 2
+
+    distances = np.empty((2, num_pairs), dtype=np.float64)
+    filled = np.zeros(num_pairs, dtype=bool)
+
+    for chunk in _iter_rfdistance_chunks(rfdistances_file_path):
+        tree_idx1 = chunk[:, 0].astype(np.int64)
+        tree_idx2 = chunk[:, 1].astype(np.int64)
+        if np.any(tree_idx1 == tree_idx2) or np.any(np.maximum(tree_idx1, tree_idx2) >= num_trees):
+            raise ValueError(f"The given input file {rfdistances_file_path} contains invalid tree pairs.")
+        indices = condensed_index(tree_idx1, tree_idx2, num_trees)
+        distances[0, indices] = chunk[:, 2]
+        distances[1, indices] = chunk[:, 3]
+        filled[indices] = True
+
+    if not np.all(filled):
+        raise ValueError(
+            f"The given input file {rfdistances_file_path} does not contain the distances of all {num_pairs} tree pairs."
+        )
+
+    if use_cache:
+        tmp_cache_file = f"{cache_file}.{os.getpid()}.tmp.npy"
+        np.save(tmp_cache_file, distances)
+        os.replace(tmp_cache_file, cache_file)
+        if mmap:
+            distances = np.load(cache_file, mmap_mode="r")
+
+    return RFDistances(distances[0], distances[1], num_trees)
+
+
 def get_pairwise_rfdistances(
         rfdistances_file_path: FilePath,
 ) -> Tuple[TreeTreeIndexed, TreeTreeIndexed]:
-    with open(rfdistances_file_path) as f:
-        rfdistances = f.readlines()
-
     abs_res = {}
     rel_res = {}
 
-    for line in rfdistances:
-        idx1, idx2, plain, norm = get_cleaned_rf_dist(line)
-        abs_res[(idx1, idx2)] = plain
-        rel_res[(idx1, idx2)] = norm
+    for chunk in _iter_rfdistance_chunks(rfdistances_file_path):
+        pairs = list(zip(chunk[:, 0].astype(int).tolist(), chunk[:, 1].astype(int).tolist()))
+        abs_res.update(zip(pairs, chunk[:, 2].tolist()))
+        rel_res.update(zip(pairs, chunk[:, 3].tolist()))
 
-    return abs_res, rel_res
\ No newline at end of file
+    return abs_res, rel_res
@@ -0,0 +1,270 @@
+from .custom_types import *
+from .statstest_results import StatsTestResults
+
+from concurrent.futures import ProcessPoolExecutor
+import math
+import numpy as np
+from statistics import NormalDist
+
+
+# scale factors of the multiscale bootstrap for the AU test (as in CONSEL and IQ-Tree)
+AU_SCALES = [0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4]
+TEST_NAMES = ["bp-RELL", "p-KH", "p-SH", "p-WKH", "p-WSH", "c-ELW", "p-AU"]
+
+# number of bootstrap replicates per task, fixed so the results do not depend on the number of processes
+_CHUNK_REPLICATES = 1000
+# maximum number of cells of the (replicates, sites) weight matrices
+_BATCH_CELLS = 1 << 22
+
+_NORMAL = NormalDist()
+
+# per-site log-likelihoods and site weights shared with the worker processes
+_shared_site_llhs = None
+_shared_site_weights = None
+
+
+def _init_worker(site_llhs: np.ndarray, site_weights: np.ndarray) -> None:
+    global _shared_site_llhs, _shared_site_weights
+    _shared_site_llhs = site_llhs
+    _shared_site_weights = site_weights
+
+
+def _count_ml_trees(boot_llhs: np.ndarray) -> np.ndarray:
+    # number of replicates in which each tree has the highest likelihood, ties are split evenly
+    is_max = boot_llhs >= boot_llhs.max(axis=1, keepdims=True)
+    return (is_max / is_max.sum(axis=1, keepdims=True)).sum(axis=0)
+
+
+def _resample(
+    seed: np.random.SeedSequence, scale: float, num_replicates: int, keep_llhs: bool
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Draws num_replicates RELL bootstrap replicates of scale * sites sites and returns the number of replicates
+    in which each tree has the highest likelihood and, if keep_llhs is set, the (replicates, trees) log-likelihoods.
+    """
+    site_llhs = _shared_site_llhs
+    num_sites = int(_shared_site_weights.sum())
+    site_probs = _shared_site_weights / num_sites
+    batch_size = max(1, _BATCH_CELLS // max(1, site_llhs.shape[1]))
+
+    rng = np.random.default_rng(seed)
+    ml_counts = np.zeros(site_llhs.shape[0])
+    all_llhs = []
+    for start in range(0, num_replicates, batch_size):
+        weights = rng.multinomial(
+            round(scale * num_sites), site_probs, size=min(batch_size, num_replicates - start)
+        )
+        boot_llhs = weights @ site_llhs.T
+        ml_counts += _count_ml_trees(boot_llhs)
+        if keep_llhs:
+            all_llhs.append(boot_llhs)
+
+    return ml_counts, np.concatenate(all_llhs) if keep_llhs else None
+
+
+def _get_confidence_set(values: np.ndarray, level: float = 0.95) -> np.ndarray:
+    # trees with the highest values until their sum reaches the level
+    order = np.argsort(-values, kind="stable")
+    cumulative = np.cumsum(values[order])
+    num_included = int(np.searchsorted(cumulative, level - 1e-12)) + 1
+    included = np.zeros(len(values), dtype=bool)
+    included[order[:num_included]] = True
+    return included
+
+
+def _kh_test(llhs: np.ndarray, centered: np.ndarray) -> np.ndarray:
+    # one-sided KH test of each tree against the best tree, the best tree is tested against the second best tree
+    num_trees = len(llhs)
+    if num_trees < 2:
+        return np.ones(num_trees)
+
+    order = np.argsort(-llhs, kind="stable")
+    reference = np.full(num_trees, order[0])
+    reference[order[0]] = order[1]
+
+    observed = llhs[reference] - llhs
+    replicates = centered[:, reference] - centered
+    return (replicates >= observed - 1e-9).mean(axis=0)
+
+
+def _sh_test(llhs: np.ndarray, centered: np.ndarray) -> np.ndarray:
+    observed = llhs.max() - llhs
+    replicates = centered.max(axis=1, keepdims=True) - centered
+    return (replicates >= observed - 1e-9).mean(axis=0)
+
+
+def _wsh_test(llhs: np.ndarray, boot_llhs: np.ndarray, centered: np.ndarray) -> np.ndarray:
+    # SH test on differences standardized by the bootstrap standard deviation of each pair of trees
+    p_values = np.ones(len(llhs))
+    for i in range(len(llhs)):
+        sd = (boot_llhs - boot_llhs[:, [i]]).std(axis=0)
+        sd[sd == 0] = np.inf
+        observed = ((llhs - llhs[i]) / sd).max()
+        replicates = ((centered - centered[:, [i]]) / sd).max(axis=1)
+        p_values[i] = (replicates >= observed - 1e-9).mean()
+    return p_values
+
+
+def _elw(boot_llhs: np.ndarray) -> np.ndarray:
+    weights = np.exp(boot_llhs - boot_llhs.max(axis=1, keepdims=True))
+    return (weights / weights.sum(axis=1, keepdims=True)).mean(axis=0)
+
+
+def _au_test(bp: np.ndarray, scales: List[float], num_replicates: int) -> np.ndarray:
+    """
+    Fits bp(r) = 1 - Phi(v * sqrt(r) + c / sqrt(r)) to the bootstrap probabilities of each tree at the scales r
+    using weighted least squares and returns the approximately unbiased p-values 1 - Phi(v - c).
+
+    Args:
+        bp: Array of shape (scales, trees), the fraction of replicates in which the tree has the highest likelihood.
+    """
+    r = np.array(scales)
+    x = np.stack([np.sqrt(r), 1 / np.sqrt(r)], axis=1)
+    p_values = np.empty(bp.shape[1])
+
+    for i in range(bp.shape[1]):
+        valid = (bp[:, i] > 0) & (bp[:, i] < 1)
+        if valid.sum() < 2:
+            # bp is 0 or 1 at (almost) all scales
+            p_values[i] = float(np.round(bp[:, i].mean()))
+            continue
+
+        z = np.array([_NORMAL.inv_cdf(1 - p) for p in bp[valid, i]])
+        density = np.exp(-z ** 2 / 2) / math.sqrt(2 * math.pi)
+        w = num_replicates * density ** 2 / (bp[valid, i] * (1 - bp[valid, i]))
+
+        xv = x[valid]
+        v, c = np.linalg.lstsq(xv * np.sqrt(w)[:, np.newaxis], z * np.sqrt(w), rcond=None)[0]
+        p_values[i] = 1 - _NORMAL.cdf(v - c)
+
+    return np.clip(p_values, 0, 1)
+
+
+def _run_resampling(
+    site_llhs: np.ndarray,
+    site_weights: np.ndarray,
+    scales: List[float],
+    num_replicates: int,
+    seed: Optional[int],
+    processes: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    tasks = []
+    for scale in scales:
+        for start in range(0, num_replicates, _CHUNK_REPLICATES):
+            tasks.append((scale, min(_CHUNK_REPLICATES, num_replicates - start), scale == 1.0))
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    args = [(s, scale, n, keep) for s, (scale, n, keep) in zip(seeds, tasks)]
+
+    if processes > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_worker, initargs=(site_llhs, site_weights)
+        ) as executor:
+            results = list(executor.map(_resample, *zip(*args)))
+    else:
+        _init_worker(site_llhs, site_weights)
+        try:
+            results = [_resample(*a) for a in args]
+        finally:
+            _init_worker(None, None)
+
+    bp = np.zeros((len(scales), site_llhs.shape[0]))
+    boot_llhs = []
+    for (scale, _, keep), (ml_counts, llhs) in zip(tasks, results):
+        bp[scales.index(scale)] += ml_counts / num_replicates
+        if keep:
+            boot_llhs.append(llhs)
+
+    return bp, np.concatenate(boot_llhs)
+
+
+def get_rell_test_results(
+    site_llhs: np.ndarray,
+    n_bootstrap_replicates: int = 10_000,
+    site_weights: np.ndarray = None,
+    scales: List[float] = None,
+    seed: int = None,
+    processes: int = 1,
+) -> StatsTestResults:
+    """
+    Performs the tree topology tests bp-RELL, KH, SH, weighted KH, weighted SH, ELW and AU
+    using RELL bootstrap resampling of the per-site log-likelihoods.
+    Each batch of replicates is a multinomial (replicates, sites) weight matrix multiplied with the site log-likelihoods.
+
+    Args:
+        site_llhs: Array of shape (trees, sites) with the log-likelihood of each site under each tree.
+        n_bootstrap_replicates: Number of bootstrap replicates (per scale for the AU test).
+        site_weights: Number of occurrences of each site (pattern), defaults to 1 for each site.
+        scales: Scale factors of the multiscale bootstrap, defaults to AU_SCALES. Has to contain 1.0.
+        seed: Random seed.
+        processes: Number of processes, the replicates are split into chunks of 1000 replicates.
+
+    Returns:
+        The results in the format of get_iqtree_results: the llh, deltaL, the score and significance of each test
+        and whether the tree passed all tests. A test is significant ("+") if the tree is contained in the
+        95% confidence set (bp-RELL, c-ELW) or the p-value is at least 0.05.
+
+    Raises:
+        ValueError if the shapes do not match or the scales do not contain 1.0.
+    """
+    site_llhs = np.ascontiguousarray(site_llhs, dtype=np.float64)
+    if site_llhs.ndim != 2:
+        raise ValueError(f"The site log-likelihoods need to be a 2D array (trees, sites), got {site_llhs.ndim}D.")
+    num_trees, num_sites = site_llhs.shape
+
+    site_weights = np.ones(num_sites) if site_weights is None else np.asarray(site_weights, dtype=np.float64)
+    if site_weights.shape != (num_sites,):
+        raise ValueError(f"Number of site weights ({site_weights.size}) does not match the number of sites ({num_sites}).")
+
+    scales = list(AU_SCALES if scales is None else scales)
+    if 1.0 not in scales:
+        raise ValueError("The scales of the multiscale bootstrap need to contain 1.0.")
+
+    llhs = site_llhs @ site_weights
+    bp, boot_llhs = _run_resampling(site_llhs, site_weights, scales, n_bootstrap_replicates, seed, processes)
+    centered = boot_llhs - boot_llhs.mean(axis=0)
+
+    bp_rell = bp[scales.index(1.0)]
+    kh = _kh_test(llhs, centered)
+    elw = _elw(boot_llhs)
+
+    scores = {
+        "bp-RELL": bp_rell,
+        "p-KH": kh,
+        "p-SH": _sh_test(llhs, centered),
+        # standardizing the differences to the best tree does not change the one-sided comparison of the KH test
+        "p-WKH": kh,
+        "p-WSH": _wsh_test(llhs, boot_llhs, centered),
+        "c-ELW": elw,
+        "p-AU": _au_test(bp, scales, n_bootstrap_replicates),
+    }
+    significant = {test: values >= 0.05 for test, values in scores.items()}
+    significant["bp-RELL"] = _get_confidence_set(bp_rell)
+    significant["c-ELW"] = _get_confidence_set(elw)
+
+    columns = {"logL": llhs, "deltaL": llhs.max() - llhs}
+    for test in TEST_NAMES:
+        columns[f"tests/{test}/score"] = scores[test]
+        columns[f"tests/{test}/significant"] = significant[test]
+    columns["plausible"] = np.all([significant[test] for test in TEST_NAMES], axis=0)
+
+    return StatsTestResults(columns)
+
+
+def to_consel_results(results: StatsTestResults) -> StatsTestResults:
+    """
+    Converts the results of get_rell_test_results to the format of get_consel_results.
+    bp-Mult is the bootstrap probability at scale 1 and bayesPosteriorProb the normalized likelihood of each tree.
+    """
+    llhs = results["logL"]
+    ranks = np.empty(len(llhs), dtype=np.int64)
+    ranks[np.argsort(-llhs, kind="stable")] = np.arange(1, len(llhs) + 1)
+    posterior = np.exp(llhs - llhs.max())
+    posterior /= posterior.sum()
+
+    columns = {"deltaL": results["deltaL"], "rank": ranks}
+    for test in ["bp-RELL", "p-KH", "p-SH", "p-WKH", "p-WSH", "p-AU"]:
+        columns[f"tests/{test}"] = results[f"tests/{test}/score"]
+    columns["tests/bp-Mult"] = results["tests/bp-RELL/score"]
+    columns["tests/bayesPosteriorProb"] = posterior
+
+    return StatsTestResults(columns)
@@ -0,0 +1,248 @@
+from .consel_parser import get_consel_results
+from .custom_types import *
+from .iqtree_parser import get_iqtree_llh
+from .iqtree_statstest_parser import iter_iqtree_results
+from .raxml8_parser import get_raxml_execution_time
+from .raxml8_statstest_parser import get_raxml_elwtest_results, get_raxml_shtest_results
+from .raxmlng_parser import RaxmlNGLog
+from .utils import get_file_hash
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import sqlite3
+import time
+
+
+RESULT_TYPES = ["raxmlng", "iqtree", "raxml8", "consel"]
+
+
+def get_result_type(file_path: FilePath) -> Optional[str]:
+    """
+    Returns the type of the given output file based on its name, or None if it is not a supported output file.
+    """
+    name = os.path.basename(file_path)
+    if name.endswith(".raxml.log"):
+        return "raxmlng"
+    if name.endswith(".iqtree"):
+        return "iqtree"
+    if name.startswith("RAxML_info."):
+        return "raxml8"
+    if name.endswith(".consel"):
+        return "consel"
+    return None
+
+
+def _try(parse, *args):
+    try:
+        return parse(*args)
+    except ValueError:
+        return None
+
+
+def _parse_iqtree(file_path: FilePath) -> Dict:
+    return {
+        "llh": _try(get_iqtree_llh, file_path),
+        "tests": _try(lambda f: list(iter_iqtree_results(f)), file_path),
+    }
+
+
+def _get_raxml8_tests(file_path: FilePath) -> Set[str]:
+    # RAxML_info files of other runs do not contain a test table, so only the parsers of the performed tests are run
+    tests = set()
+    with open(file_path) as f:
+        for line in f:
+            if line.startswith("Tree") and "Significantly Worse" in line:
+                tests.add("sh_test")
+            elif line.startswith("Original"):
+                tests.add("elw_test")
+    return tests
+
+
+def _parse_raxml8(file_path: FilePath) -> Dict:
+    tests = _get_raxml8_tests(file_path)
+    return {
+        "execution_time": get_raxml_execution_time(file_path),
+        "sh_test": get_raxml_shtest_results(file_path).to_dicts() if "sh_test" in tests else None,
+        "elw_test": get_raxml_elwtest_results(file_path).to_dicts() if "elw_test" in tests else None,
+    }
+
+
+_RESULT_PARSERS = {
+    "raxmlng": lambda f: RaxmlNGLog(f).to_record()._asdict(),
+    "iqtree": _parse_iqtree,
+    "raxml8": _parse_raxml8,
+    "consel": lambda f: get_consel_results(f).to_dicts(),
+}
+
+
+def parse_result_file(file_path: FilePath) -> Dict:
+    """
+    Parses the given output file with the parsers of the respective tool.
+
+    Raises:
+        ValueError if the file type is not supported.
+    """
+    result_type = get_result_type(file_path)
+    if result_type is None:
+        raise ValueError(f"This file type is currently not supported: {file_path}")
+    return _RESULT_PARSERS[result_type](file_path)
+
+
+def _index_file(
+    file_path: FilePath, indexed_hash: Optional[str] = None
+) -> Tuple[FilePath, str, Optional[str], Optional[str]]:
+    content_hash = get_file_hash(file_path)
+    if content_hash == indexed_hash:
+        # the content did not change, so the indexed result is kept and the file is not parsed again
+        return file_path, content_hash, None, None
+    try:
+        return file_path, content_hash, json.dumps(parse_result_file(file_path)), None
+    except Exception as e:
+        return file_path, content_hash, None, f"{type(e).__name__}: {e}"
+
+
+class ResultIndex:
+    """
+    SQLite index of parsed RAxML-NG, IQ-TREE, RAxML8 and CONSEL output files.
+
+    Crawling a directory only parses files that are new or whose content changed since the last crawl.
+    Each file is identified by its path, size, modification time and content hash.
+    """
+
+    def __init__(self, db_file: FilePath):
+        self.db_file = db_file
+        self._connection = sqlite3.connect(db_file)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                path TEXT PRIMARY KEY,
+                result_type TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                indexed_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS results_type ON results (result_type)")
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "ResultIndex":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _find_files(self, directory: FilePath) -> Dict[FilePath, os.stat_result]:
+        files = {}
+        for root, _, file_names in os.walk(directory):
+            for name in file_names:
+                if get_result_type(name) is not None:
+                    path = os.path.abspath(os.path.join(root, name))
+                    files[path] = os.stat(path)
+        return files
+
+    def crawl(self, directory: FilePath, processes: int = 1) -> Dict[str, int]:
+        """
+        Walks the directory and updates the index: new and changed files are parsed (in processes worker processes),
+        entries of files that no longer exist in the directory are removed. Files whose size or modification time
+        changed are hashed first and only parsed again if their content hash differs from the indexed one.
+
+        Returns:
+            A dict with the number of "parsed", "unchanged", "removed" and "failed" files.
+        """
+        directory = os.path.abspath(directory)
+        files = self._find_files(directory)
+
+        indexed = {
+            path: (size, mtime_ns, content_hash)
+            for path, size, mtime_ns, content_hash in self._connection.execute(
+                "SELECT path, size, mtime_ns, content_hash FROM results WHERE path = ? OR path LIKE ? ESCAPE '\\'",
+                (directory, directory.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + os.sep + "%"),
+            )
+        }
+
+        removed = [path for path in indexed if path not in files]
+        to_check = [
+            path for path, stat in files.items()
+            if indexed.get(path, (None, None))[:2] != (stat.st_size, stat.st_mtime_ns)
+        ]
+
+        indexed_hashes = [indexed.get(path, (None, None, None))[2] for path in to_check]
+        if processes > 1 and len(to_check) > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                indexed_files = list(executor.map(_index_file, to_check, indexed_hashes, chunksize=16))
+        else:
+            indexed_files = [_index_file(path, content_hash) for path, content_hash in zip(to_check, indexed_hashes)]
+
+        stats = {"parsed": 0, "unchanged": len(files) - len(to_check), "removed": len(removed), "failed": 0}
+        now = time.time()
+
+        with self._connection:
+            self._connection.executemany("DELETE FROM results WHERE path = ?", [(p,) for p in removed])
+
+            for path, content_hash, result, error in indexed_files:
+                stat = files[path]
+                if path in indexed and indexed[path][2] == content_hash:
+                    # only the modification time changed, the content is the same
+                    self._connection.execute(
+                        "UPDATE results SET size = ?, mtime_ns = ? WHERE path = ?",
+                        (stat.st_size, stat.st_mtime_ns, path),
+                    )
+                    stats["unchanged"] += 1
+                    continue
+
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (path, get_result_type(path), stat.st_size, stat.st_mtime_ns, content_hash, result, error, now),
+                )
+                stats["parsed"] += 1
+                if error is not None:
+                    stats["failed"] += 1
+
+        return stats
+
+    def get(self, file_path: FilePath) -> Optional[Dict]:
+        """
+        Returns the indexed result of the given file or None if the file is not indexed or could not be parsed.
+        """
+        row = self._connection.execute(
+            "SELECT result FROM results WHERE path = ?", (os.path.abspath(file_path),)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def query(
+        self, result_type: str = None, path_pattern: str = None, include_failed: bool = False
+    ) -> Iterator[Tuple[FilePath, str, Optional[Dict], Optional[str]]]:
+        """
+        Yields (path, result_type, result, error) for all indexed files matching the filters.
+
+        Args:
+            result_type: Only return files of this type, one of RESULT_TYPES.
+            path_pattern: Only return files whose absolute path matches this glob pattern (SQLite GLOB syntax).
+            include_failed: Also return files that could not be parsed, their result is None.
+        """
+        conditions = []
+        params = []
+        if result_type is not None:
+            conditions.append("result_type = ?")
+            params.append(result_type)
+        if path_pattern is not None:
+            conditions.append("path GLOB ?")
+            params.append(path_pattern)
+        if not include_failed:
+            conditions.append("error IS NULL")
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        for path, result_type, result, error in self._connection.execute(
+            f"SELECT path, result_type, result, error FROM results {where} ORDER BY path", params
+        ):
+            yield path, result_type, json.loads(result) if result is not None else None, error
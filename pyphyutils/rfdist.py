@@ -0,0 +1,223 @@
+from .custom_types import *
+from .raxmlng_parser import RFDistances
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import numpy as np
+import regex
+
+
+# tokens of a newick string: quoted labels, comments, structural characters and unquoted labels/branch lengths
+_NEWICK_TOKEN_RE = regex.compile(r"'(?:[^']|'')*'|\[[^\]]*\]|[(),:;]|[^(),:;\[\]\s']+")
+
+# maximum number of cells of the split indicator matrices of a block of trees
+_TILE_CELLS = 1 << 24
+
+
+def _get_label(token: str) -> str:
+    if token.startswith("'"):
+        return token[1:-1].replace("''", "'")
+    return token
+
+
+def get_newick_leaves(newick: NewickString) -> List[str]:
+    """
+    Returns the leaf labels of the given newick string in order of appearance.
+    """
+    leaves = []
+    previous = None
+    for token in _NEWICK_TOKEN_RE.findall(newick):
+        if token.startswith("["):
+            continue
+        if token not in "(),:;" and previous in (None, "(", ","):
+            leaves.append(_get_label(token))
+        previous = token
+    return leaves
+
+
+def get_newick_splits(newick: NewickString, taxon_index: Dict[str, int]) -> FrozenSet[int]:
+    """
+    Returns the non-trivial bipartitions (splits) of the tree as bitsets over the given taxon index.
+    Each split is normalised to the side that does not contain the taxon with index 0,
+    so the splits are independent of the rooting and the order of the children.
+
+    Raises:
+        ValueError if the tree contains a leaf that is not in the taxon index, contains a leaf twice
+            or does not contain all taxa of the index.
+    """
+    num_taxa = len(taxon_index)
+    all_taxa = (1 << num_taxa) - 1
+
+    stack = [0]
+    clade_masks = []
+    previous = None
+
+    for token in _NEWICK_TOKEN_RE.findall(newick):
+        if token.startswith("["):
+            continue
+        if token == "(":
+            stack.append(0)
+        elif token == ")":
+            mask = stack.pop()
+            clade_masks.append(mask)
+            stack[-1] |= mask
+        elif token not in ",:;" and previous in (None, "(", ","):
+            label = _get_label(token)
+            if label not in taxon_index:
+                raise ValueError(f"The taxon {label} is not contained in all trees.")
+            leaf = 1 << taxon_index[label]
+            if stack[-1] & leaf:
+                raise ValueError(f"The taxon {label} occurs more than once in the tree.")
+            stack[-1] |= leaf
+        previous = token
+
+    if len(stack) != 1:
+        raise ValueError(f"Unbalanced parentheses in newick string {newick[:20]}...")
+    if stack[0] != all_taxa:
+        raise ValueError(f"The tree {newick[:20]}... does not contain all {num_taxa} taxa.")
+
+    splits = set()
+    for mask in clade_masks:
+        if mask & 1:
+            mask ^= all_taxa
+        size = bin(mask).count("1")
+        if 1 < size < num_taxa - 1:
+            splits.add(mask)
+
+    return frozenset(splits)
+
+
+def get_topology_hash(newick: NewickString) -> str:
+    """
+    Returns a canonical hash of the unrooted topology of the tree.
+    The hash is independent of the rooting, the order of the children, branch lengths and support values,
+    so two trees have the same hash if and only if they have the same taxa and RF distance 0.
+    """
+    taxa = sorted(get_newick_leaves(newick))
+    splits = get_newick_splits(newick, {taxon: i for i, taxon in enumerate(taxa)})
+
+    topology_hash = hashlib.sha256()
+    topology_hash.update("\0".join(taxa).encode())
+    for split in sorted(splits):
+        topology_hash.update(b"\0" + format(split, "x").encode())
+    return topology_hash.hexdigest()
+
+
+def get_tree_splits(trees: List[NewickString]) -> Tuple[List[str], List[FrozenSet[int]]]:
+    """
+    Parses all trees once and returns the shared taxon index (sorted taxon names)
+    and the set of split bitsets of each tree.
+    """
+    taxa = sorted(get_newick_leaves(trees[0])) if trees else []
+    taxon_index = {taxon: i for i, taxon in enumerate(taxa)}
+    return taxa, [get_newick_splits(tree, taxon_index) for tree in trees]
+
+
+def get_topology_clusters(trees: List[NewickString]) -> List[List[TreeIndex]]:
+    """
+    Groups the trees by topology (RF distance 0).
+
+    Returns:
+        A list of clusters in order of their first tree, each cluster is the list of indices of its trees.
+    """
+    _, tree_splits = get_tree_splits(trees)
+    clusters = {}
+    for i, splits in enumerate(tree_splits):
+        clusters.setdefault(splits, []).append(i)
+    return list(clusters.values())
+
+
+def _get_split_indicators(tree_splits: List[FrozenSet[int]]) -> Tuple[List[np.ndarray], int]:
+    split_ids = {}
+    tree_split_ids = []
+    for splits in tree_splits:
+        tree_split_ids.append(np.array([split_ids.setdefault(s, len(split_ids)) for s in splits], dtype=np.int64))
+    return tree_split_ids, len(split_ids)
+
+
+def _fill_block_distances(
+    block_start: int, block_end: int, rows: np.ndarray, cols: np.ndarray, offsets: np.ndarray, abs_distances: np.ndarray
+) -> None:
+    """
+    Writes the absolute RF distances of the trees block_start, ..., block_end - 1 to all trees with a larger index
+    into their rows of the condensed abs_distances.
+    Only the splits of the trees in the block are relevant, so the shared splits are counted with a matrix
+    multiplication of the (block trees, block splits) and (trees >= block_start, block splits) indicator matrices.
+    """
+    num_trees = len(offsets) - 1
+    sizes = np.diff(offsets)
+
+    block_cols = cols[offsets[block_start]:offsets[block_end]]
+    block_rows = rows[offsets[block_start]:offsets[block_end]] - block_start
+    block_splits, block_split_idx = np.unique(block_cols, return_inverse=True)
+
+    other_cols = cols[offsets[block_start]:]
+    other_rows = rows[offsets[block_start]:] - block_start
+    common = np.zeros((block_end - block_start, num_trees - block_start), dtype=np.float64)
+    if block_splits.size > 0:
+        block_indicators = np.zeros((block_end - block_start, block_splits.size), dtype=np.float32)
+        block_indicators[block_rows, block_split_idx.ravel()] = 1
+
+        positions = np.minimum(np.searchsorted(block_splits, other_cols), block_splits.size - 1)
+        shared = block_splits[positions] == other_cols
+        other_indicators = np.zeros((num_trees - block_start, block_splits.size), dtype=np.float32)
+        other_indicators[other_rows[shared], positions[shared]] = 1
+        # the float32 products are exact, each count is at most the number of splits of a tree
+        common = np.rint(block_indicators @ other_indicators.T)
+
+    for i in range(block_start, block_end):
+        row_start = i * num_trees - i * (i + 1) // 2
+        shared_counts = common[i - block_start, i + 1 - block_start:]
+        abs_distances[row_start:row_start + num_trees - i - 1] = sizes[i] + sizes[i + 1:] - 2 * shared_counts
+
+
+def _fill_abs_distances(tree_split_ids: List[np.ndarray], abs_distances: np.ndarray, threads: int) -> None:
+    """
+    Fills the condensed abs_distances in blocks of trees, each block writes directly into its rows of the output.
+    The blocks are sized such that the indicator matrices have at most about _TILE_CELLS cells.
+    """
+    num_trees = len(tree_split_ids)
+    sizes = np.array([len(ids) for ids in tree_split_ids], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    rows = np.repeat(np.arange(num_trees, dtype=np.int64), sizes)
+    cols = np.concatenate(tree_split_ids) if tree_split_ids else np.empty(0, dtype=np.int64)
+
+    block_size = max(1, _TILE_CELLS // max(1, num_trees * int(sizes.max(initial=1))))
+    blocks = [(start, min(start + block_size, num_trees)) for start in range(0, num_trees, block_size)]
+
+    def _fill_blocks(thread_blocks):
+        for block_start, block_end in thread_blocks:
+            _fill_block_distances(block_start, block_end, rows, cols, offsets, abs_distances)
+
+    if threads > 1 and len(blocks) > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(_fill_blocks, [blocks[i::threads] for i in range(threads)]))
+    else:
+        _fill_blocks(blocks)
+
+
+def compute_rf_distances(trees: List[NewickString], threads: int = 1) -> RFDistances:
+    """
+    Computes the pairwise RF distances of all trees as raxml-ng --rfdist does:
+    the absolute RF distance is the number of splits contained in only one of the two trees,
+    the relative RF distance is the absolute distance divided by the maximum distance 2 * (taxa - 3).
+
+    Args:
+        trees: List of newick strings, all trees need to contain the same set of taxa.
+        threads: Number of threads for the pairwise computation.
+
+    Returns:
+        The pairwise distances as RFDistances in condensed layout.
+    """
+    trees = [t for t in trees if t.strip()]
+    taxa, tree_splits = get_tree_splits(trees)
+    num_trees = len(trees)
+
+    tree_split_ids, _ = _get_split_indicators(tree_splits)
+    abs_distances = np.empty(num_trees * (num_trees - 1) // 2, dtype=np.float64)
+    _fill_abs_distances(tree_split_ids, abs_distances, threads)
+
+    max_distance = 2 * (len(taxa) - 3)
+    rel_distances = abs_distances / max_distance if max_distance > 0 else np.zeros_like(abs_distances)
+
+    return RFDistances(abs_distances, rel_distances, num_trees)
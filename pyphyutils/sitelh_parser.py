@@ -0,0 +1,125 @@
+from .custom_types import *
+
+import numpy as np
+import os
+
+
+def _iter_token_chunks(file_path: FilePath, chunk_size: int) -> Iterator[List[bytes]]:
+    # yields the whitespace separated tokens of the file in chunks, tokens are never split between chunks
+    remainder = b""
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            chunk = remainder + chunk
+            tokens = chunk.split()
+            if tokens and not chunk[-1:].isspace():
+                remainder = tokens.pop()
+            else:
+                remainder = b""
+            yield tokens
+    if remainder:
+        yield [remainder]
+
+
+def _is_number(token: bytes) -> bool:
+    try:
+        float(token)
+        return True
+    except ValueError:
+        return False
+
+
+def _parse_site_llhs(sitelh_file: FilePath, values: np.ndarray, chunk_size: int) -> None:
+    num_trees, num_sites = values.shape
+    tree = site = 0
+    # the header contains the number of trees and sites
+    header_tokens = 2
+
+    for tokens in _iter_token_chunks(sitelh_file, chunk_size):
+        i = min(header_tokens, len(tokens))
+        header_tokens -= i
+
+        while i < len(tokens):
+            if tree >= num_trees:
+                raise ValueError(f"The given input file {sitelh_file} contains more than {num_trees} trees.")
+            if site == 0 and not _is_number(tokens[i]):
+                # name of the tree, e.g. "Site_Lh" (IQ-Tree), "tr1" (RAxML) or "tree1" (RAxML-NG)
+                i += 1
+                continue
+
+            n = min(num_sites - site, len(tokens) - i)
+            values[tree, site:site + n] = np.array(tokens[i:i + n], dtype=np.float64)
+            i += n
+            site += n
+            if site == num_sites:
+                tree += 1
+                site = 0
+
+    if tree != num_trees:
+        raise ValueError(
+            f"The given input file {sitelh_file} contains {tree} complete trees, but the header announces {num_trees}."
+        )
+
+
+def get_sitelh_dimensions(sitelh_file: FilePath) -> Tuple[int, int]:
+    """
+    Returns the number of trees and sites from the header line of the per-site log-likelihood file.
+
+    Raises:
+        ValueError if the file does not start with the number of trees and sites.
+    """
+    with open(sitelh_file, "rb") as f:
+        header = f.readline().split()
+
+    if len(header) < 2 or not header[0].isdigit() or not header[1].isdigit():
+        raise ValueError(
+            f"The given input file {sitelh_file} does not start with the number of trees and sites."
+        )
+    return int(header[0]), int(header[1])
+
+
+def load_site_llhs(
+    sitelh_file: FilePath, use_cache: bool = True, mmap: bool = True, chunk_size: int = 1 << 24
+) -> np.ndarray:
+    """
+    Loads the per-site log-likelihoods of all trees into a float64 array of shape (trees, sites).
+
+    Supports the files in PUZZLE/TREE-PUZZLE format written by RAxML8 (RAxML_perSiteLLs.*, -f G),
+    IQ-Tree (.sitelh, -wsl) and RAxML-NG (.raxml.siteLH, --sitelh): a header line with the number of trees and sites
+    followed by the name and the site log-likelihoods of each tree. The file is parsed in chunks of chunk_size bytes.
+
+    Args:
+        sitelh_file: Path to the per-site log-likelihood file.
+        use_cache: If set, the values are parsed directly into the sidecar file sitelh_file + ".npy".
+            Subsequent loads read the sidecar instead of parsing the text file as long as it is newer than the text file.
+        mmap: Memory-map the sidecar file instead of reading it into memory.
+
+    Returns:
+        The per-site log-likelihoods, read-only if memory-mapped.
+
+    Raises:
+        ValueError if the file is not in the expected format or the number of values does not match the header.
+    """
+    cache_file = sitelh_file + ".npy"
+    if use_cache and os.path.isfile(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(sitelh_file):
+        return np.load(cache_file, mmap_mode="r" if mmap else None)
+
+    shape = get_sitelh_dimensions(sitelh_file)
+
+    if not use_cache:
+        values = np.empty(shape, dtype=np.float64)
+        _parse_site_llhs(sitelh_file, values, chunk_size)
+        return values
+
+    # parse directly into the memory-mapped sidecar file, so the values are never held in memory at once
+    tmp_cache_file = f"{cache_file}.{os.getpid()}.tmp.npy"
+    try:
+        values = np.lib.format.open_memmap(tmp_cache_file, mode="w+", dtype=np.float64, shape=shape)
+        _parse_site_llhs(sitelh_file, values, chunk_size)
+        values.flush()
+        del values
+        os.replace(tmp_cache_file, cache_file)
+    finally:
+        if os.path.exists(tmp_cache_file):
+            os.remove(tmp_cache_file)
+
+    return np.load(cache_file, mmap_mode="r" if mmap else None)
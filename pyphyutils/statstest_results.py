@@ -0,0 +1,137 @@
+from .custom_types import *
+
+import numpy as np
+
+
+# separator of the nested dict keys in the column names, e.g. "tests/p-AU/score"
+COLUMN_SEPARATOR = "/"
+
+
+def _flatten(entry: Dict, prefix: str = "") -> Iterator[Tuple[str, object]]:
+    for key, value in entry.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}{COLUMN_SEPARATOR}")
+        else:
+            yield prefix + key, value
+
+
+def _to_python(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class StatsTestResults:
+    """
+    Columnar container for the results of statistical tree topology tests with one NumPy array per metric.
+    Nested metrics are stored in columns named by their path, e.g. "tests/p-AU/score".
+
+    The container behaves like the list of dicts returned by the parsers before:
+    indexing and iterating yield the dict of the respective tree, these dicts are only built on access.
+    """
+
+    __slots__ = ("_columns", "_num_rows")
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        lengths = {len(c) for c in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"All columns need to have the same length, got lengths {sorted(lengths)}.")
+        self._columns = {name: np.asarray(c) for name, c in columns.items()}
+        self._num_rows = lengths.pop() if lengths else 0
+
+    @classmethod
+    def from_dicts(cls, entries: List[Dict]) -> "StatsTestResults":
+        """
+        Builds the columns from a list of (nested) dicts. Missing values are nan for float columns and None otherwise.
+        """
+        values = {}
+        for i, entry in enumerate(entries):
+            for name, value in _flatten(entry):
+                values.setdefault(name, [None] * len(entries))[i] = value
+
+        columns = {}
+        for name, column in values.items():
+            if any(v is None for v in column) and all(isinstance(v, (float, type(None))) for v in column):
+                column = [np.nan if v is None else v for v in column]
+            columns[name] = np.array(column, dtype=object if any(v is None for v in column) else None)
+        return cls(columns)
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns)
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            return self._columns[index]
+        if isinstance(index, slice):
+            return StatsTestResults({name: c[index] for name, c in self._columns.items()})
+        return self._get_dict(range(self._num_rows)[index])
+
+    def __len__(self) -> int:
+        return self._num_rows
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(self._num_rows):
+            yield self._get_dict(i)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, StatsTestResults):
+            other = other.to_dicts()
+        return self.to_dicts() == other
+
+    # the results are mutable NumPy arrays
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"StatsTestResults({self._num_rows} trees, columns={self.columns})"
+
+    def _get_dict(self, i: int) -> Dict:
+        entry = {}
+        for name, column in self._columns.items():
+            *path, key = name.split(COLUMN_SEPARATOR)
+            node = entry
+            for part in path:
+                node = node.setdefault(part, {})
+            value = _to_python(column[i])
+            if not (column.dtype == object and value is None):
+                node[key] = value
+        return entry
+
+    def to_dicts(self) -> TreeIndexed[Dict]:
+        """
+        Returns the results as list of (nested) dicts as returned by the parsers before.
+        """
+        return list(self)
+
+    def to_numpy(self, columns: List[str] = None) -> np.ndarray:
+        """
+        Returns a float64 array of shape (trees, columns) with the given columns, defaults to all numeric and boolean columns.
+        """
+        if columns is None:
+            columns = [n for n, c in self._columns.items() if c.dtype != object]
+        if not columns:
+            return np.empty((self._num_rows, 0))
+        return np.stack([self._columns[n].astype(np.float64) for n in columns], axis=1)
+
+    def to_records(self) -> np.recarray:
+        """
+        Returns all columns as NumPy record array with one record per tree.
+        """
+        return np.rec.fromarrays(list(self._columns.values()), names=self.columns)
+
+    def to_arrow(self):
+        """
+        Returns all columns as pyarrow Table. Requires pyarrow.
+        """
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("Exporting results to Arrow requires pyarrow.")
+        return pyarrow.table({n: (c.tolist() if c.dtype == object else c) for n, c in self._columns.items()})
+
+    def to_parquet(self, output_file: FilePath) -> None:
+        """
+        Writes all columns to the given parquet file. Requires pyarrow.
+        """
+        table = self.to_arrow()
+        import pyarrow.parquet
+
+        pyarrow.parquet.write_table(table, output_file)
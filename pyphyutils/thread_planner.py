@@ -0,0 +1,146 @@
+from .custom_types import *
+from .job_runner import Job, THREADS_OPTIONS
+
+import heapq
+import math
+import os
+
+
+# raxml-ng modes that run multi-threaded, a raxml-ng command without mode option runs a tree search
+RAXMLNG_THREADED_MODES = [
+    "--search", "--search1", "--all", "--evaluate", "--bootstrap", "--sitelh", "--loglh", "--ancestral",
+]
+# raxml-ng modes that run single-threaded (e.g. --rfdist, --parse)
+RAXMLNG_SINGLE_THREADED_MODES = [
+    "--rfdist", "--parse", "--check", "--start", "--consense", "--support", "--bsconverge", "--bsmsa", "--terrace",
+]
+
+# minimum number of alignment patterns per thread for an efficient parallelization as recommended by RAxML-NG
+PATTERNS_PER_THREAD = {"DNA": 1000, "AA": 250}
+
+
+def get_max_useful_threads(num_patterns: int, data_type: str = "DNA", patterns_per_thread: int = None) -> int:
+    """
+    Returns the number of threads above which adding more threads does not pay off for an alignment
+    with the given number of patterns.
+    """
+    patterns_per_thread = patterns_per_thread or PATTERNS_PER_THREAD[data_type]
+    return max(1, math.ceil(num_patterns / patterns_per_thread))
+
+
+def plan_threads(
+    pattern_counts: List[int],
+    cores: int = None,
+    data_type: str = "DNA",
+    patterns_per_thread: int = None,
+) -> List[int]:
+    """
+    Chooses the number of threads of each job such that all jobs together use the available cores.
+
+    Every job gets one thread. As long as there are fewer threads than cores, the job with the most
+    patterns per thread gets one more thread, unless it already reached its maximum useful number of threads.
+    If there are at least as many jobs as cores, all jobs are single-threaded: running jobs side by side
+    is always more efficient than parallelizing each job.
+
+    Args:
+        pattern_counts: Number of alignment patterns of each job.
+        cores: Number of available cores, defaults to the number of CPU cores.
+        data_type: "DNA" or "AA", determines the default number of patterns per thread.
+        patterns_per_thread: Minimum number of patterns per thread, overrides the data_type default.
+
+    Returns:
+        The number of threads of each job.
+    """
+    cores = cores or os.cpu_count() or 1
+    threads = [1] * len(pattern_counts)
+    max_threads = [
+        min(cores, get_max_useful_threads(p, data_type, patterns_per_thread)) for p in pattern_counts
+    ]
+
+    # max-heap of (patterns per thread, job index) of all jobs that can use another thread
+    heap = [(-p, i) for i, p in enumerate(pattern_counts) if max_threads[i] > 1]
+    heapq.heapify(heap)
+
+    free_cores = cores - len(pattern_counts)
+    while free_cores > 0 and heap:
+        _, i = heapq.heappop(heap)
+        threads[i] += 1
+        free_cores -= 1
+        if threads[i] < max_threads[i]:
+            heapq.heappush(heap, (-pattern_counts[i] / threads[i], i))
+
+    return threads
+
+
+def is_threaded_command(cmd: Command) -> bool:
+    """
+    Returns whether the command can use multiple threads: commands that set the number of threads,
+    IQ-Tree commands (-pre) and raxml-ng commands (--prefix) that run a multi-threaded mode
+    (see RAXMLNG_THREADED_MODES), e.g. raxml-ng --rfdist or --parse are single-threaded.
+    """
+    if any(option in THREADS_OPTIONS for option in cmd[:-1]):
+        return True
+    if "--prefix" in cmd:
+        if any(option in RAXMLNG_SINGLE_THREADED_MODES for option in cmd):
+            return False
+        return any(option in RAXMLNG_THREADED_MODES for option in cmd) or "--msa" in cmd
+    return "-pre" in cmd
+
+
+def set_command_threads(cmd: Command, threads: int) -> Command:
+    """
+    Returns a copy of the raxml-ng or IQ-Tree command with the number of threads set to threads.
+
+    Raises:
+        ValueError if the command does not set the number of threads and is not a multi-threaded
+        raxml-ng or IQ-Tree command (see is_threaded_command).
+    """
+    cmd = list(cmd)
+    for i, option in enumerate(cmd[:-1]):
+        if option in THREADS_OPTIONS:
+            cmd[i + 1] = str(threads)
+            return cmd
+
+    if is_threaded_command(cmd):
+        if "--prefix" in cmd:
+            return cmd + ["--threads", str(threads)]
+        return cmd + ["-T", str(threads)]
+
+    raise ValueError(f"Cannot set the number of threads of the command \"{' '.join(cmd)}\".")
+
+
+def plan_jobs(
+    cmds: List[Command],
+    pattern_counts: List[int],
+    cores: int = None,
+    data_type: str = "DNA",
+    patterns_per_thread: int = None,
+) -> List[Job]:
+    """
+    Plans the number of threads of each command (see plan_threads) and returns the adjusted commands as jobs
+    for job_runner.run_jobs. Single-threaded commands (see is_threaded_command) are kept as they are and
+    occupy one core each. The jobs are ordered by decreasing number of patterns, so the longest jobs
+    start first and the short jobs fill up the remaining cores.
+
+    Raises:
+        ValueError if the number of commands and pattern counts differ.
+    """
+    if len(cmds) != len(pattern_counts):
+        raise ValueError(
+            f"Number of commands ({len(cmds)}) does not match the number of pattern counts ({len(pattern_counts)})."
+        )
+
+    cores = cores or os.cpu_count() or 1
+    threaded = [i for i, cmd in enumerate(cmds) if is_threaded_command(cmd)]
+    threads = [1] * len(cmds)
+    # each single-threaded command occupies one core
+    threaded_cores = max(1, cores - (len(cmds) - len(threaded)))
+    planned_threads = plan_threads([pattern_counts[i] for i in threaded], threaded_cores, data_type, patterns_per_thread)
+    for i, t in zip(threaded, planned_threads):
+        threads[i] = t
+
+    order = sorted(range(len(cmds)), key=lambda i: pattern_counts[i], reverse=True)
+    return [
+        Job(cmd=set_command_threads(cmds[i], threads[i]) if i in threaded else list(cmds[i]), threads=threads[i])
+        for i in order
+    ]
@@ -1,8 +1,19 @@
 from .custom_types import *
+from .job_runner import Job, check_job_result, run_jobs
+from functools import lru_cache
+import hashlib
+import math
+import os
 import subprocess
 from statistics import median
 
 
+# directory for persistent caches, can be changed using the environment variable PYPHYUTILS_CACHE_DIR
+DEFAULT_CACHE_DIR = os.environ.get(
+    "PYPHYUTILS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "pyphyutils")
+)
+
+
 def tukeys_fence(values, k=3):
     values = sorted(values)
 
@@ -21,9 +32,62 @@ def tukeys_fence(values, k=3):
     return lower, upper
 
 
-def run_cmd(cmd: Command) -> None:
+def chi2_survival(x: float, df: int) -> float:
+    """
+    Returns the p-value P(X >= x) of a chi-square distributed random variable X with df degrees of freedom,
+    i.e. the regularized upper incomplete gamma function Q(df / 2, x / 2).
+    """
+    if df <= 0:
+        return float("nan")
+    if x <= 0:
+        return 1.0
+
+    a = df / 2.0
+    x = x / 2.0
+    log_prefactor = a * math.log(x) - x - math.lgamma(a)
+
+    if x < a + 1:
+        # series expansion of the lower incomplete gamma function
+        term = total = 1.0 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1.0 - total * math.exp(log_prefactor))
+
+    # continued fraction of the upper incomplete gamma function (modified Lentz's method)
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return math.exp(log_prefactor) * h
+
+
+def run_cmd(cmd: Command, timeout: float = None) -> None:
+    """
+    Runs the command and blocks until it is finished. stdout of the command is discarded.
+    Use job_runner.run_jobs to run multiple commands concurrently.
+
+    Raises:
+        subprocess.CalledProcessError if the command exits with a non-zero exit code.
+        subprocess.TimeoutExpired if the command runs longer than timeout seconds.
+    """
     try:
-        subprocess.check_output(cmd)
+        check_job_result(run_jobs([Job(cmd=cmd, timeout=timeout)])[0])
     except Exception as e:
         print(f"Error running command \"{' '.join(cmd)}\"")
         raise e
@@ -63,3 +127,31 @@ def get_single_value_from_file(input_file: FilePath, search_string: str) -> floa
     raise ValueError(
         f"The given input file {input_file} does not contain the search string '{search_string}'."
     )
+
+
+def get_file_hash(file_path: FilePath, chunk_size: int = 1 << 20) -> str:
+    """
+    Returns the SHA-256 hex digest of the content of the given file.
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def get_executable_version(executable: Executable) -> str:
+    """
+    Returns the first non-empty line that the executable prints when called with --version.
+    The result is cached for the lifetime of the process.
+    """
+    output = subprocess.run(
+        [executable, "--version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False
+    ).stdout.decode(errors="replace")
+
+    for line in output.splitlines():
+        if line.strip():
+            return line.strip()
+
+    raise ValueError(f"The executable {executable} did not report a version.")